@@ -0,0 +1,259 @@
+// Filters the graphs by dates in the browser, from the decisions per month and
+// bar computed by clientside.py. Figures are built as in figure_builders.py.
+
+const INTEGER_ARRAYS = {
+    uint8: Uint8Array,
+    uint16: Uint16Array,
+    uint32: Uint32Array,
+};
+
+// decoded arrays of each graph of the store, kept as long as the store
+const DECODED_GRAPHS = new WeakMap();
+
+function decodeIntegers(encoded) {
+    // typed arrays use the byte order of the platform, little endian everywhere
+    // browsers run nowadays
+    const bytes = Uint8Array.from(atob(encoded.data), (c) => c.charCodeAt(0));
+    return new INTEGER_ARRAYS[encoded.dtype](bytes.buffer);
+}
+
+function decodeGraph(graph) {
+    if (!DECODED_GRAPHS.has(graph)) {
+        const columns = {};
+        for (const [column, encoded] of Object.entries(graph.columns)) {
+            columns[column] = {
+                values: encoded.values,
+                codes: decodeIntegers(encoded.codes),
+            };
+        }
+        DECODED_GRAPHS.set(graph, {
+            months: decodeIntegers(graph.months),
+            keys: decodeIntegers(graph.keys),
+            nDecisions: decodeIntegers(graph.n_decisions),
+            columns: columns,
+        });
+    }
+    return DECODED_GRAPHS.get(graph);
+}
+
+function toMonth(date, defaultMonth) {
+    if (!date) {
+        return defaultMonth;
+    }
+    const [year, month] = date.split("-").map(Number);
+    return year * 12 + month - 1;
+}
+
+function getRows(graph, decoded, figure, startMonth, endMonth) {
+    // decisions per bar over the selected months
+    const nKeys = Object.values(decoded.columns)[0].codes.length;
+    const sums = new Float64Array(nKeys);
+    for (let i = 0; i < decoded.months.length; i++) {
+        const month = graph.first_month + decoded.months[i];
+        if (month >= startMonth && month <= endMonth) {
+            sums[decoded.keys[i]] += decoded.nDecisions[i];
+        }
+    }
+
+    // bars having decisions, in the order of group_sum then the graph order;
+    // codes follow the order of the values and the sort is stable
+    const keys = [];
+    for (let key = 0; key < nKeys; key++) {
+        if (sums[key] > 0) {
+            keys.push(key);
+        }
+    }
+    keys.sort((a, b) => {
+        for (const column of graph.sort) {
+            const codes = decoded.columns[column].codes;
+            if (codes[a] !== codes[b]) {
+                return codes[a] - codes[b];
+            }
+        }
+        return 0;
+    });
+
+    return keys.map((key) => {
+        const row = {};
+        for (const [column, encoded] of Object.entries(decoded.columns)) {
+            row[column] = encoded.values[encoded.codes[key]];
+        }
+        row[figure.y] = sums[key];
+        return row;
+    });
+}
+
+function getLabel(column, labels) {
+    return column in labels ? labels[column] : column;
+}
+
+function getCustomColumns(figure) {
+    return (figure.hover_data || []).filter(
+        (column) => column !== figure.x && column !== figure.y
+    );
+}
+
+function getHoverTemplate(figure, colorValue) {
+    const labels = figure.labels || {};
+    const customColumns = getCustomColumns(figure);
+
+    const getField = (column) => {
+        if (column === figure.x) {
+            return "%{x}";
+        }
+        if (column === figure.y) {
+            return "%{y}";
+        }
+        if (customColumns.includes(column)) {
+            return `%{customdata[${customColumns.indexOf(column)}]}`;
+        }
+        return colorValue;
+    };
+
+    let columns = [figure.x, figure.y, ...customColumns];
+    if (figure.color && figure.color !== figure.x) {
+        columns = [
+            figure.color,
+            ...columns.filter((column) => column !== figure.color),
+        ];
+    }
+
+    return (
+        columns
+            .map((column) => `${getLabel(column, labels)}=${getField(column)}`)
+            .join("<br>") + "<extra></extra>"
+    );
+}
+
+function getTraces(type, rows, figure, defaultColors) {
+    // one trace per value of the color column, in order of appearance
+    const groups = new Map();
+    if (!figure.color) {
+        groups.set(null, rows);
+    }
+    for (const row of figure.color ? rows : []) {
+        const value = row[figure.color];
+        if (!groups.has(value)) {
+            groups.set(value, []);
+        }
+        groups.get(value).push(row);
+    }
+
+    const colorMap = figure.color_discrete_map || {};
+    const colorSequence = figure.color_discrete_sequence || defaultColors;
+    const customColumns = getCustomColumns(figure);
+
+    return Array.from(groups.entries()).map(([value, group], i) => {
+        const name = value === null ? "" : value;
+        const color =
+            value in colorMap
+                ? colorMap[value]
+                : colorSequence[i % colorSequence.length];
+
+        const trace = {
+            type: type,
+            x: group.map((row) => row[figure.x]),
+            y: group.map((row) => row[figure.y]),
+            name: name,
+            legendgroup: name,
+            showlegend: value !== null,
+            hovertemplate: getHoverTemplate(figure, value),
+        };
+        if (customColumns.length) {
+            trace.customdata = group.map((row) =>
+                customColumns.map((column) => row[column])
+            );
+        }
+
+        if (type === "bar") {
+            Object.assign(trace, {
+                marker: {color: color},
+                alignmentgroup: "True",
+                offsetgroup: name,
+                orientation: "v",
+            });
+        } else {
+            Object.assign(trace, {mode: "lines", line: {color: color}});
+        }
+        return trace;
+    });
+}
+
+function getLayout(type, figure, traces, data) {
+    const labels = figure.labels || {};
+    const legend = Object.assign({}, data.base_layout.legend);
+    if (figure.color) {
+        legend.title = {text: getLabel(figure.color, labels)};
+    }
+
+    const layout = Object.assign({}, data.base_layout, {
+        template: data.template,
+        xaxis: {title: {text: getLabel(figure.x, labels)}},
+        yaxis: {title: {text: getLabel(figure.y, labels)}},
+        legend: legend,
+    });
+
+    if (type === "bar") {
+        layout.barmode = figure.barmode || "relative";
+        if (figure.color && figure.color === figure.x) {
+            Object.assign(layout.xaxis, {
+                categoryorder: "array",
+                categoryarray: traces.map((trace) => trace.name),
+            });
+        }
+    } else if (figure.range_x) {
+        layout.xaxis.range = figure.range_x;
+    }
+    return layout;
+}
+
+function addRollingMean(rows, column, window, meanColumn) {
+    // centered rolling mean, as pandas rolling(window, center=True).mean()
+    const offset = Math.floor(window / 2);
+    rows.forEach((row, i) => {
+        const start = i - offset;
+        const end = start + window;
+        if (start < 0 || end > rows.length) {
+            row[meanColumn] = null;
+            return;
+        }
+        let sum = 0;
+        for (let j = start; j < end; j++) {
+            sum += rows[j][column];
+        }
+        row[meanColumn] = sum / window;
+    });
+}
+
+function getFigure(graph, data, startMonth, endMonth) {
+    const figure = graph.figure;
+    const rows = getRows(graph, decodeGraph(graph), figure, startMonth, endMonth);
+
+    const traces = getTraces("bar", rows, figure, data.default_colors);
+    const layout = getLayout("bar", figure, traces, data);
+
+    if (graph.smoothed) {
+        const smoothedFigure = graph.smoothed.figure;
+        addRollingMean(rows, figure.y, graph.smoothed.window, smoothedFigure.y);
+        traces.push(
+            ...getTraces("scatter", rows, smoothedFigure, data.default_colors)
+        );
+    }
+
+    return {data: traces, layout: layout};
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    judilibre: {
+        updateGraphs: function (data, startDate, endDate) {
+            if (!data) {
+                throw window.dash_clientside.PreventUpdate;
+            }
+            const startMonth = toMonth(startDate, -Infinity);
+            const endMonth = toMonth(endDate, Infinity);
+            return Object.values(data.graphs).map((graph) =>
+                getFigure(graph, data, startMonth, endMonth)
+            );
+        },
+    },
+});
@@ -0,0 +1,148 @@
+import logging
+import os
+import statistics
+import time
+
+import pandas as pd
+from data.engines import ENGINES
+from data.load_data import clean_data
+from data.load_data import get_download_data
+from data.load_data import group_data
+from data.load_data import read_data
+from data.materialize_data import load_cube
+from data.pyramid import get_pyramid
+from figure_executor import build_figure
+from figure_executor import GRAPH_BUILDERS
+
+DOWNLOAD_CHOICES = ["ca_location", "ca_nac", "ca_location_nac"]
+
+# graphs that do not depend on the dates selected in the application
+GLOBAL_GRAPH_IDS = ["source-graph", "time-graph"]
+LOCATION_GRAPH_IDS = [
+    "time-location-graph",
+    "nac-location-graph",
+    "level-location-graph",
+]
+
+LOCATIONS = ["Paris", "Versailles", "Aix-en-Provence"]
+
+
+def time_function(function, n_repeats: int = 5, **kwargs):
+    """Returns the result and the median duration of a function"""
+    durations = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        result = function(**kwargs)
+        durations.append(time.perf_counter() - start)
+    return result, statistics.median(durations)
+
+
+def get_tasks(path: str, start_date=None, end_date=None):
+    """Returns the name, function and arguments of each aggregation to compare"""
+    df, _ = read_data(path=path)
+    df_clean = clean_data(df)
+    cube = load_cube(path=path)
+    pyramid = get_pyramid(cube)
+
+    tasks = [
+        ("group_data", group_data, {"df": df_clean}),
+        ("get_pyramid", get_pyramid, {"df": cube}),
+    ]
+    for choice in DOWNLOAD_CHOICES:
+        tasks.append(
+            (f"download:{choice}", get_download_data, {"df": cube, "choice": choice})
+        )
+    for graph_id in GRAPH_BUILDERS:
+        kwargs = {"df": cube, "graph_id": graph_id, "pyramid": pyramid}
+        if graph_id not in GLOBAL_GRAPH_IDS:
+            kwargs.update(start_date=start_date, end_date=end_date)
+        if graph_id in LOCATION_GRAPH_IDS:
+            kwargs["locations"] = LOCATIONS
+        # comparing the serialized figures
+        tasks.append(
+            (
+                f"graph:{graph_id}",
+                lambda **kwargs: build_figure(**kwargs).to_json(),
+                kwargs,
+            )
+        )
+    return tasks
+
+
+def assert_same_result(reference, result):
+    if isinstance(reference, dict):
+        assert reference.keys() == result.keys()
+        for key in reference:
+            assert_same_result(reference[key], result[key])
+    elif isinstance(reference, pd.DataFrame):
+        pd.testing.assert_frame_equal(result, reference)
+    else:
+        assert result == reference, "Different figures"
+
+
+def compare_engines(
+    path: str = "./data", start_date=None, end_date=None, n_repeats: int = 5
+):
+    """Times every aggregation with each engine, checking that they all give
+    the result of the pandas engine.
+
+    The engine is selected through AGGREGATION_ENGINE, as in the application.
+    """
+    default_engine = os.environ.get("AGGREGATION_ENGINE")
+
+    results = {}
+    for name, function, kwargs in get_tasks(
+        path=path, start_date=start_date, end_date=end_date
+    ):
+        results[name] = {}
+        reference = None
+        for engine in ENGINES:
+            os.environ["AGGREGATION_ENGINE"] = engine
+            result, duration = time_function(function, n_repeats=n_repeats, **kwargs)
+            if reference is None:
+                reference = result
+            else:
+                assert_same_result(reference, result)
+            results[name][engine] = duration
+
+    if default_engine is None:
+        os.environ.pop("AGGREGATION_ENGINE")
+    else:
+        os.environ["AGGREGATION_ENGINE"] = default_engine
+
+    return results
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument(
+        "-p", "--path", default="./data", help="Folder containing the data"
+    )
+    argument_parser.add_argument("--start-date", default=None, help="YYYY-MM-DD")
+    argument_parser.add_argument("--end-date", default=None, help="YYYY-MM-DD")
+    argument_parser.add_argument(
+        "-n", "--n-repeats", default=5, type=int, help="Number of runs per engine"
+    )
+
+    arguments = argument_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    results = compare_engines(
+        path=arguments.path,
+        start_date=arguments.start_date,
+        end_date=arguments.end_date,
+        n_repeats=arguments.n_repeats,
+    )
+
+    for name, durations in results.items():
+        logging.info(
+            f"{name:>30}: "
+            + ", ".join(
+                f"{engine} {duration * 1000:.1f} ms"
+                for engine, duration in durations.items()
+            )
+        )
@@ -0,0 +1,108 @@
+import logging
+import statistics
+import time
+
+import graphs
+from benchmarks import graphs_px
+from data.cache import get_data_cache
+from data.load_data import slice_dates
+from data.pyramid import get_pyramid
+
+GRAPH_NAMES = [
+    "source",
+    "time",
+    "location",
+    "nac",
+    "chamber",
+    "type",
+    "nac_level",
+    "formation_time",
+    "time_location",
+    "nac_location",
+    "nac_level_location",
+]
+
+# graphs now built from the time pyramid of the cube
+PYRAMID_GRAPH_NAMES = ["time", "time_location", "formation_time"]
+
+LOCATIONS = ["Paris", "Versailles", "Aix-en-Provence"]
+
+
+def time_figure(function, n_repeats: int = 5, **kwargs):
+    """Returns the median duration of building and serializing a figure"""
+    durations = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        function(**kwargs).to_json()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def compare_figures(
+    path: str = "./data", start_date=None, end_date=None, n_repeats: int = 5
+):
+    """Compares the plotly express and graph objects versions of every graph"""
+    df = get_data_cache(path=path).get()
+    df_dates = slice_dates(df, start_date=start_date, end_date=end_date)
+    pyramid = get_pyramid(df)
+
+    results = {}
+    for name in GRAPH_NAMES:
+        kwargs = {"df": df if name in ["source", "time"] else df_dates}
+        go_kwargs = kwargs
+        if name in PYRAMID_GRAPH_NAMES:
+            go_kwargs = {"pyramid": pyramid}
+            if name != "time":
+                go_kwargs.update(start_date=start_date, end_date=end_date)
+        if name.endswith("_location"):
+            kwargs["locations"] = LOCATIONS
+            go_kwargs["locations"] = LOCATIONS
+
+        function_name = f"get_{name}_graph"
+        # the first call of plotly express loads its own modules
+        getattr(graphs_px, function_name)(**kwargs)
+
+        px_duration = time_figure(
+            getattr(graphs_px, function_name), n_repeats=n_repeats, **kwargs
+        )
+        go_duration = time_figure(
+            getattr(graphs, function_name), n_repeats=n_repeats, **go_kwargs
+        )
+        results[name] = {
+            "px": px_duration,
+            "go": go_duration,
+            "speedup": px_duration / go_duration,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument(
+        "-p", "--path", default="./data", help="Folder containing the data"
+    )
+    argument_parser.add_argument("--start-date", default=None, help="YYYY-MM-DD")
+    argument_parser.add_argument("--end-date", default=None, help="YYYY-MM-DD")
+    argument_parser.add_argument(
+        "-n", "--n-repeats", default=5, type=int, help="Number of runs per version"
+    )
+
+    arguments = argument_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    results = compare_figures(
+        path=arguments.path,
+        start_date=arguments.start_date,
+        end_date=arguments.end_date,
+        n_repeats=arguments.n_repeats,
+    )
+
+    for name, result in results.items():
+        logging.info(
+            f"{name:>20}: px {result['px'] * 1000:.1f} ms, "
+            f"go {result['go'] * 1000:.1f} ms, x{result['speedup']:.1f}"
+        )
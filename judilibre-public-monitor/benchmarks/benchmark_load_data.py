@@ -0,0 +1,169 @@
+import gc
+import logging
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+import pyarrow as pa
+from data.data_utils import FORMATIONS_CC
+from data.data_utils import JURISDICTIONS
+from data.data_utils import LOCATIONS
+from data.data_utils import remove_cour_dappel
+from data.data_utils import SOURCES
+from data.data_utils import TYPES
+from data.load_data import load_data
+
+
+def load_data_rowwise(
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    nac_reference_filename: str = "nac_reference.csv",
+):
+    """Former implementation of `load_data`, cleaning the data row by row"""
+    df = pd.read_parquet(os.path.join(path, main_filename))
+
+    df_nac = pd.read_csv(os.path.join(path, nac_reference_filename))
+
+    df.loc[df["jurisdiction"] == "cc", "location"] = "Cour de cassation"
+
+    df["court"] = "Cour de casation"
+    df.loc[df["jurisdiction"] == "ca", "court"] = df.loc[
+        df["jurisdiction"] == "ca", "location"
+    ].apply(lambda location: LOCATIONS.get(location, "Non renseigné"))
+
+    df["location"] = df["court"].apply(remove_cour_dappel)
+
+    df["formation_clean"] = "Non renseigné"
+
+    df.loc[df["jurisdiction"] == "cc", "formation_clean"] = df.loc[
+        df["jurisdiction"] == "cc", "chamber"
+    ].apply(FORMATIONS_CC.get)
+
+    df["jurisdiction"] = df["jurisdiction"].apply(
+        lambda jurisidction: JURISDICTIONS.get(jurisidction, "Non renseigné")
+    )
+
+    df["decision_date"] = pd.to_datetime(df["decision_date"])
+
+    df["type"] = df["type"].apply(lambda t: TYPES.get(t, "Autre"))
+    df["source"] = df["source"].apply(lambda source: SOURCES.get(source, "Autre"))
+
+    df.loc[df["nac"].isna(), "nac"] = "Non renseigné"
+
+    df["n_decisions"] = 1
+
+    df = (
+        df.groupby(
+            [
+                "source",
+                "jurisdiction",
+                "court",
+                "location",
+                "nac",
+                "formation_clean",
+                "type",
+                "decision_date",
+            ]
+        )
+        .agg({"n_decisions": "sum"})
+        .reset_index()
+    )
+
+    df = pd.merge(
+        left=df, right=df_nac, how="left", left_on=["nac"], right_on=["Code NAC"]
+    )
+
+    return df
+
+
+def get_process_memory(key: str):
+    """Returns a memory size of the process in /proc/self/status, such as VmRSS
+    or its peak VmHWM, in bytes"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{key}:"):
+                return int(line.split()[1]) * 1024
+
+
+def reset_peak_memory():
+    """Resets the peak resident memory of the process to its current resident
+    memory, returning whether the system allows it"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def measure(function, **kwargs):
+    """Returns the result, duration and peak memory of a call.
+
+    The peak is the one of the resident memory of the process, so that the
+    buffers of Arrow and numpy, allocated outside of the Python allocator, are
+    counted. Where it cannot be reset, as outside of Linux, the peak is the one
+    traced by tracemalloc plus the growth of the peak of the Arrow memory pool.
+    """
+    gc.collect()
+    pool = pa.default_memory_pool()
+    pool.release_unused()
+
+    if reset_peak_memory():
+        rss = get_process_memory("VmRSS")
+        start = time.perf_counter()
+        result = function(**kwargs)
+        duration = time.perf_counter() - start
+        return result, duration, get_process_memory("VmHWM") - rss
+
+    pool_peak = pool.max_memory()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(**kwargs)
+    duration = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak_memory + pool.max_memory() - pool_peak
+
+
+def compare_load_data(path: str = "./data", n_repeats: int = 3):
+    results = {}
+    for name, function in [("rowwise", load_data_rowwise), ("vectorized", load_data)]:
+        durations = []
+        for _ in range(n_repeats):
+            df, duration, peak_memory = measure(function, path=path)
+            durations.append(duration)
+        results[name] = {
+            "duration": min(durations),
+            "peak_memory": peak_memory,
+            "result_memory": df.memory_usage(deep=True).sum(),
+            "n_lines": df.shape[0],
+        }
+    return results
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument(
+        "-p", "--path", default="./data", help="Folder containing the data"
+    )
+    argument_parser.add_argument(
+        "-n", "--n-repeats", default=3, type=int, help="Number of runs per version"
+    )
+
+    arguments = argument_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    results = compare_load_data(path=arguments.path, n_repeats=arguments.n_repeats)
+
+    for name, result in results.items():
+        logging.info(
+            f"{name:>10}: {result['duration']:.2f}s, "
+            f"peak memory {result['peak_memory'] / 1e6:.0f} MB, "
+            f"result memory {result['result_memory'] / 1e6:.1f} MB "
+            f"({result['n_lines']} lines)"
+        )
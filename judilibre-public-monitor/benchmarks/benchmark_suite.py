@@ -0,0 +1,343 @@
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from benchmarks.benchmark_load_data import measure
+from data.dataset import get_id_index
+from data.dataset import write_parquet_file
+from data.generate_fake_data import generate_data
+from data.load_data import aggregate_data
+from data.load_data import get_download_data
+from data.load_data import load_data
+from data.materialize_data import write_cube
+from data.pyramid import get_pyramid
+from downloads import DOWNLOAD_FORMATS
+from downloads import iter_chunks
+from figure_executor import build_figure
+from figure_executor import GRAPH_BUILDERS
+
+SIZES = [100_000]
+
+DOWNLOAD_CHOICES = ["ca_location", "ca_nac", "ca_location_nac", "all_data", "all_ids"]
+
+# graphs that do not depend on the dates selected in the application
+GLOBAL_GRAPH_IDS = ["source-graph", "time-graph"]
+LOCATION_GRAPH_IDS = [
+    "time-location-graph",
+    "nac-location-graph",
+    "level-location-graph",
+]
+
+START_DATE = "2000-01-01"
+END_DATE = "2020-12-31"
+LOCATIONS = ["Paris", "Versailles", "Aix-en-Provence"]
+
+# a slower run is a regression above both thresholds
+DURATION_THRESHOLD = 0.2
+MIN_DURATION_DIFFERENCE = 0.01
+MEMORY_THRESHOLD = 0.2
+MIN_MEMORY_DIFFERENCE = 1_000_000
+
+
+def get_corpus_path(path: str, n_decisions: int):
+    return os.path.join(path, f"corpus_{n_decisions}")
+
+
+def generate_corpus(path: str, n_decisions: int):
+    """Generates a corpus of fake decisions, unless it already exists"""
+    raw_data_path = os.path.join(path, "raw_data")
+    raw_data_file = os.path.join(raw_data_path, "fake_data.parquet")
+    if os.path.exists(raw_data_file):
+        return
+
+    os.makedirs(raw_data_path, exist_ok=True)
+    generate_data(
+        ca_sample_size=n_decisions // 2,
+        cc_sample_size=n_decisions - n_decisions // 2,
+        filename=raw_data_file,
+    )
+    shutil.copy(
+        os.path.join(os.path.dirname(__file__), "..", "data", "nac_reference.csv"),
+        path,
+    )
+
+
+def serialize_download(df, data_format: str):
+    """Serializes a download chunk by chunk, as the download route, returning
+    the size of the file"""
+    _, serialize = DOWNLOAD_FORMATS[data_format]
+    return sum(len(data) for data in serialize(iter_chunks(df)))
+
+
+def run_benchmark(results: dict, name: str, function, n_repeats: int = 3, **kwargs):
+    """Runs a function `n_repeats` times, keeping its shortest duration and
+    largest peak memory"""
+    durations, peak_memories = [], []
+    for _ in range(n_repeats):
+        result, duration, peak_memory = measure(function, **kwargs)
+        durations.append(duration)
+        peak_memories.append(peak_memory)
+
+    results[name] = {"duration": min(durations), "peak_memory": max(peak_memories)}
+    logging.info(
+        f"{name:>40}: {min(durations):.3f}s, "
+        f"peak memory {max(peak_memories) / 1e6:.1f} MB"
+    )
+    return result
+
+
+def benchmark_callbacks(path: str, n_repeats: int = 3):
+    """Times the callbacks of the application serving the data of `path`.
+
+    Runs in a process of its own, as the application reads its data folder
+    when it is imported.
+    """
+    logging.basicConfig(level=logging.INFO)
+    os.environ["DATA_PATH"] = path
+    os.environ["UPDATE_DATA"] = "0"
+    os.environ.setdefault("INCLUDE_DOWNLOAD", "0")
+    import main
+
+    main.DATA_CACHE.get()
+
+    def update_graphs():
+        main.FIGURE_CACHE.clear()
+        return main.update_graphs(START_DATE, END_DATE)
+
+    def update_time_location_graph():
+        main.FIGURE_CACHE.clear()
+        return main.update_time_location_graph(LOCATIONS, START_DATE, END_DATE)
+
+    results = {}
+    run_benchmark(
+        results,
+        "callback:update_global_outputs",
+        main.get_global_outputs,
+        n_repeats=n_repeats,
+        df=main.DATA_CACHE.get(),
+    )
+    run_benchmark(results, "callback:update_graphs", update_graphs, n_repeats=n_repeats)
+    run_benchmark(
+        results,
+        "callback:update_time_location_graph",
+        update_time_location_graph,
+        n_repeats=n_repeats,
+    )
+    return results
+
+
+def run_suite(path: str, n_decisions: int, n_repeats: int = 3):
+    """Benchmarks the ingest, load and render paths on a corpus of fake
+    decisions, generated under `path` on the first run"""
+    corpus_path = get_corpus_path(path, n_decisions)
+    generate_corpus(corpus_path, n_decisions)
+
+    logging.info(f"Benchmarking {n_decisions} decisions in {corpus_path}")
+
+    results = {}
+
+    df = run_benchmark(
+        results,
+        "aggregate_data",
+        aggregate_data,
+        n_repeats=n_repeats,
+        path_to_raw_data=os.path.join(corpus_path, "raw_data"),
+    )
+    write_parquet_file(df, os.path.join(corpus_path, "full_data.parquet"))
+    del df
+
+    # reads skipping most row groups
+    for name, kwargs in [
+        ("load_data:ca", {"jurisdictions": ["ca"]}),
+        ("load_data:year", {"start_date": "2020-01-01", "end_date": "2020-12-31"}),
+    ]:
+        run_benchmark(
+            results,
+            name,
+            load_data,
+            n_repeats=n_repeats,
+            path=corpus_path,
+            **kwargs,
+        )
+
+    df = run_benchmark(
+        results, "load_data", load_data, n_repeats=n_repeats, path=corpus_path
+    )
+    write_cube(df, os.path.join(corpus_path, "cube.parquet"))
+
+    pyramid = run_benchmark(
+        results, "get_pyramid", get_pyramid, n_repeats=n_repeats, df=df
+    )
+
+    for graph_id in GRAPH_BUILDERS:
+        kwargs = {"df": df, "graph_id": graph_id, "pyramid": pyramid}
+        if graph_id not in GLOBAL_GRAPH_IDS:
+            kwargs.update(start_date=START_DATE, end_date=END_DATE)
+        if graph_id in LOCATION_GRAPH_IDS:
+            kwargs["locations"] = LOCATIONS
+        run_benchmark(
+            results, f"graph:{graph_id}", build_figure, n_repeats=n_repeats, **kwargs
+        )
+
+    # the all_ids download reads the id index of the decisions
+    get_id_index(path=corpus_path)
+    for choice in DOWNLOAD_CHOICES:
+        run_benchmark(
+            results,
+            f"download:{choice}",
+            get_download_data,
+            n_repeats=n_repeats,
+            df=df,
+            choice=choice,
+            path=corpus_path,
+        )
+
+    all_data = get_download_data(df=df, choice="all_data")
+    for data_format in DOWNLOAD_FORMATS:
+        run_benchmark(
+            results,
+            f"download:all_data.{data_format}",
+            serialize_download,
+            n_repeats=n_repeats,
+            df=all_data,
+            data_format=data_format,
+        )
+    del all_data
+
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        results.update(
+            executor.submit(benchmark_callbacks, corpus_path, n_repeats).result()
+        )
+
+    return results
+
+
+def get_metadata():
+    return {
+        "date": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare_results(
+    baseline: dict,
+    current: dict,
+    duration_threshold: float = DURATION_THRESHOLD,
+    memory_threshold: float = MEMORY_THRESHOLD,
+):
+    """Returns the benchmarks slower or larger in `current` than in `baseline`"""
+    regressions = []
+    for size, benchmarks in current["results"].items():
+        for name, result in benchmarks.items():
+            reference = baseline["results"].get(size, {}).get(name)
+            if reference is None:
+                continue
+
+            for metric, threshold, min_difference in [
+                ("duration", duration_threshold, MIN_DURATION_DIFFERENCE),
+                ("peak_memory", memory_threshold, MIN_MEMORY_DIFFERENCE),
+            ]:
+                difference = result[metric] - reference[metric]
+                if (
+                    difference > min_difference
+                    and difference > threshold * reference[metric]
+                ):
+                    regressions.append(
+                        {
+                            "size": size,
+                            "benchmark": name,
+                            "metric": metric,
+                            "baseline": reference[metric],
+                            "current": result[metric],
+                            "ratio": result[metric] / reference[metric],
+                        }
+                    )
+    return regressions
+
+
+if __name__ == "__main__":
+    import sys
+    from argparse import ArgumentParser
+
+    argument_parser = ArgumentParser()
+    subparsers = argument_parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument(
+        "-p",
+        "--path",
+        default="./benchmarks/corpora",
+        help="Folder of the generated corpora",
+    )
+    run_parser.add_argument(
+        "-s",
+        "--sizes",
+        nargs="+",
+        default=SIZES,
+        type=lambda size: int(float(size)),
+        help="Numbers of decisions of the corpora, such as 1e5 1e6",
+    )
+    run_parser.add_argument(
+        "-n", "--n-repeats", default=3, type=int, help="Number of runs per benchmark"
+    )
+    run_parser.add_argument(
+        "-o", "--output", default="benchmark_results.json", help="Results file"
+    )
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Report the regressions between two results files"
+    )
+    compare_parser.add_argument("baseline", help="Results file of reference")
+    compare_parser.add_argument("current", help="Results file to check")
+    compare_parser.add_argument(
+        "--duration-threshold", default=DURATION_THRESHOLD, type=float
+    )
+    compare_parser.add_argument(
+        "--memory-threshold", default=MEMORY_THRESHOLD, type=float
+    )
+
+    arguments = argument_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if arguments.command == "run":
+        results = {"metadata": get_metadata(), "results": {}}
+        for size in arguments.sizes:
+            results["results"][str(size)] = run_suite(
+                path=arguments.path, n_decisions=size, n_repeats=arguments.n_repeats
+            )
+        with open(arguments.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Results written to {arguments.output}")
+
+    else:
+        with open(arguments.baseline) as f:
+            baseline = json.load(f)
+        with open(arguments.current) as f:
+            current = json.load(f)
+
+        regressions = compare_results(
+            baseline,
+            current,
+            duration_threshold=arguments.duration_threshold,
+            memory_threshold=arguments.memory_threshold,
+        )
+        for regression in regressions:
+            logging.warning(
+                f"{regression['size']:>10} {regression['benchmark']:>40} "
+                f"{regression['metric']}: {regression['baseline']:.3g} -> "
+                f"{regression['current']:.3g} (x{regression['ratio']:.2f})"
+            )
+        logging.info(f"{len(regressions)} regressions")
+        sys.exit(1 if regressions else 0)
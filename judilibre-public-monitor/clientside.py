@@ -0,0 +1,128 @@
+import base64
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from data.load_data import group_sum
+from figure_builders import BASE_LAYOUT
+from figure_builders import DEFAULT_COLORS
+from graphs import CHAMBER_GRAPH
+from graphs import FORMATION_TIME_GRAPH
+from graphs import FORMATION_TIME_SMOOTHED_GRAPH
+from graphs import FORMATION_TIME_WINDOW
+from graphs import LOCATION_GRAPH
+from graphs import NAC_GRAPH
+from graphs import NAC_LEVEL_GRAPH
+from graphs import TYPE_GRAPH
+
+# how the browser aggregates the graphs filtered by dates, in the order of the
+# outputs of the clientside callback: lines of the cube kept, columns
+# identifying a bar, sort order of the bars and arguments of the figure
+CLIENTSIDE_GRAPHS = {
+    "location-graph": {
+        "jurisdiction": "Cours d'appel",
+        "keys": ["location"],
+        "figure": LOCATION_GRAPH,
+    },
+    "nac-graph": {
+        "jurisdiction": "Cours d'appel",
+        "keys": ["nac", "Niveau 1", "N1", "Intitulé NAC"],
+        "sort": ["N1", "nac"],
+        "figure": NAC_GRAPH,
+    },
+    "chamber-graph": {
+        "jurisdiction": "Cour de cassation",
+        "keys": ["formation_clean"],
+        "figure": CHAMBER_GRAPH,
+    },
+    "type-graph": {
+        "jurisdiction": "Cour de cassation",
+        "keys": ["type"],
+        "figure": TYPE_GRAPH,
+    },
+    "nac-level-graph": {
+        "keys": ["Niveau 2", "N1", "Niveau 1"],
+        "sort": ["N1"],
+        "figure": NAC_LEVEL_GRAPH,
+    },
+    "formation-time-graph": {
+        "jurisdiction": "Cour de cassation",
+        "keys": ["Mois"],
+        "figure": FORMATION_TIME_GRAPH,
+        "smoothed": {
+            "window": FORMATION_TIME_WINDOW,
+            "figure": FORMATION_TIME_SMOOTHED_GRAPH,
+        },
+    },
+}
+
+
+def encode_integers(values: np.ndarray):
+    """Returns non negative integers as base64 little endian bytes, using the
+    smallest unsigned type holding them"""
+    values = np.asarray(values)
+    max_value = values.max(initial=0)
+    for dtype in ["uint8", "uint16", "uint32"]:
+        if max_value <= np.iinfo(dtype).max:
+            break
+    data = values.astype(np.dtype(dtype).newbyteorder("<")).tobytes()
+    return {"dtype": dtype, "data": base64.b64encode(data).decode()}
+
+
+def encode_values(values: pd.Series):
+    """Returns a column as a dictionary of sorted distinct values and codes"""
+    codes, uniques = pd.factorize(values, sort=True)
+    if isinstance(uniques, pd.DatetimeIndex):
+        uniques = uniques.strftime("%Y-%m-%dT%H:%M:%S")
+    return {"values": uniques.tolist(), "codes": encode_integers(codes)}
+
+
+def get_months(dates: pd.Series):
+    """Returns the number of months between year 0 and each date"""
+    return dates.dt.year * 12 + dates.dt.month - 1
+
+
+def get_graph_data(df: pd.DataFrame, graph: dict):
+    """Returns the decisions of a graph per month and bar, dictionary encoded.
+
+    Each bar is a distinct combination of the key columns, in the order used by
+    `group_sum`, so that sorting them in the browser gives the same figure.
+    """
+    if "jurisdiction" in graph:
+        df = df[df["jurisdiction"] == graph["jurisdiction"]]
+
+    df = df.assign(month=get_months(df["decision_date"]))
+    facts = group_sum(df, ["month", *[key for key in graph["keys"] if key != "Mois"]])
+    if "Mois" in graph["keys"]:
+        facts["Mois"] = pd.to_datetime(
+            {"year": facts["month"] // 12, "month": facts["month"] % 12 + 1, "day": 1}
+        )
+
+    codes, keys = pd.MultiIndex.from_frame(facts[graph["keys"]]).factorize(sort=True)
+    keys = keys.to_frame(index=False, name=graph["keys"])
+
+    first_month = int(facts["month"].min()) if not facts.empty else 0
+
+    return {
+        "first_month": first_month,
+        "months": encode_integers(facts["month"].to_numpy() - first_month),
+        "keys": encode_integers(codes),
+        "n_decisions": encode_integers(facts["n_decisions"].to_numpy()),
+        "columns": {column: encode_values(keys[column]) for column in keys.columns},
+        "sort": graph.get("sort", []),
+        "figure": graph["figure"],
+        "smoothed": graph.get("smoothed"),
+    }
+
+
+def get_clientside_data(df: pd.DataFrame):
+    """Returns the data sent to the browser to filter the graphs by dates"""
+    return {
+        "template": pio.templates[pio.templates.default].to_plotly_json(),
+        "base_layout": BASE_LAYOUT,
+        "default_colors": DEFAULT_COLORS,
+        "graphs": {
+            graph_id: get_graph_data(df, graph)
+            for graph_id, graph in CLIENTSIDE_GRAPHS.items()
+        },
+    }
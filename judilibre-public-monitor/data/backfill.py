@@ -0,0 +1,315 @@
+import datetime
+import json
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .download_utils import get_export_total
+from .download_utils import PISTE_API_HEADERS
+from .download_utils import PISTE_API_URL
+from .download_utils import write_export_to_parquet
+from .piste_client import PisteClient
+
+# decisions returned at most by an export of the API
+MAX_EXPORT_DECISIONS = 10_000
+# decisions per batch of an export
+EXPORT_BATCH_SIZE = 1_000
+
+FIRST_DATE = datetime.date(year=1790, month=1, day=1)
+
+
+def get_state_file(output_path: str, jurisdiction: str):
+    return os.path.join(output_path, f"backfill_{jurisdiction}.json")
+
+
+def get_window_file(output_path: str, jurisdiction: str, start_date, end_date):
+    return os.path.join(
+        output_path, f"data_{jurisdiction}_{start_date}-{end_date}.parquet"
+    )
+
+
+def split_window(start_date: datetime.date, end_date: datetime.date, n_windows: int):
+    """Splits a window into up to `n_windows` windows of about the same length,
+    of a day at least. Consecutive windows share their bounds, as the dates of
+    the exports."""
+    n_days = (end_date - start_date).days
+    n_windows = min(n_windows, n_days)
+    bounds = [
+        start_date + datetime.timedelta(days=round(i * n_days / n_windows))
+        for i in range(n_windows + 1)
+    ]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def merge_windows(windows: list[dict], max_decisions: int = MAX_EXPORT_DECISIONS):
+    """Merges consecutive windows, sorted by date, as long as the sum of their
+    decisions stays under `max_decisions`.
+
+    Decisions updated on a bound are counted by both windows, so the merged
+    window has at most this many decisions.
+    """
+    merged = []
+    for window in windows:
+        previous = merged[-1] if merged else None
+        if (
+            previous is not None
+            and previous["end_date"] == window["start_date"]
+            and previous["total"] + window["total"] <= max_decisions
+        ):
+            previous["end_date"] = window["end_date"]
+            previous["total"] += window["total"]
+        else:
+            merged.append(dict(window))
+    return merged
+
+
+class RequestBudget:
+    """Number of requests that may still be sent, shared between threads"""
+
+    def __init__(self, max_requests: int = None):
+        self.remaining = max_requests
+        self._lock = threading.Lock()
+
+    def reserve(self, n_requests: int):
+        """Returns whether `n_requests` requests may be sent, counting them"""
+        with self._lock:
+            if self.remaining is None:
+                return True
+            if n_requests > self.remaining:
+                self.remaining = 0
+                return False
+            self.remaining -= n_requests
+            return True
+
+
+class BackfillState:
+    """Progress of the backfill of a jurisdiction between two dates.
+
+    The windows still to count are `pending`. Counted windows are in
+    `windows`, with their number of decisions, and marked once downloaded to a
+    file. The state is written atomically after each step.
+
+    A saved backfill with the same start date is resumed. If it ends before
+    `end_date`, today by default, the period after its end is added as a
+    pending window, so that the backfill is extended rather than started again.
+    """
+
+    def __init__(self, state_file: str, jurisdiction: str, start_date, end_date=None):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+
+        self.jurisdiction = jurisdiction
+        self.start_date = str(start_date)
+        self.end_date = str(end_date or datetime.date.today())
+        self.pending = [[self.start_date, self.end_date]]
+        self.windows = []
+
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                state = json.load(f)
+            if state["start_date"] == self.start_date and (
+                end_date is None or state["end_date"] <= self.end_date
+            ):
+                self.pending = state["pending"]
+                self.windows = state["windows"]
+                if state["end_date"] < self.end_date:
+                    logging.info(
+                        f"Extending the backfill of {state_file} from "
+                        f"{state['end_date']} to {self.end_date}"
+                    )
+                    self.pending.append([state["end_date"], self.end_date])
+                else:
+                    self.end_date = state["end_date"]
+            else:
+                logging.warning(
+                    f"Ignoring the backfill from {state['start_date']} to "
+                    f"{state['end_date']} of {state_file}"
+                )
+
+    def save(self):
+        with self._lock:
+            temporary_file = os.path.join(
+                os.path.dirname(self.state_file),
+                f".{os.path.basename(self.state_file)}.tmp",
+            )
+            with open(temporary_file, "w") as f:
+                json.dump(
+                    {
+                        "jurisdiction": self.jurisdiction,
+                        "start_date": self.start_date,
+                        "end_date": self.end_date,
+                        "pending": self.pending,
+                        "windows": self.windows,
+                    },
+                    f,
+                    indent=1,
+                )
+            os.replace(temporary_file, self.state_file)
+
+    def add_counts(self, counts: dict, max_decisions: int = MAX_EXPORT_DECISIONS):
+        """Plans the counted windows, splitting the ones above `max_decisions`
+        into pending windows"""
+        with self._lock:
+            pending = []
+            for start_date, end_date in self.pending:
+                total = counts.get((start_date, end_date))
+                if total is None:
+                    pending.append([start_date, end_date])
+                    continue
+                start = datetime.date.fromisoformat(start_date)
+                end = datetime.date.fromisoformat(end_date)
+                if total > max_decisions and (end - start).days > 1:
+                    pending += [
+                        [str(s), str(e)]
+                        # half as many decisions on average, some periods being
+                        # denser than others
+                        for s, e in split_window(
+                            start, end, math.ceil(2 * total / max_decisions)
+                        )
+                    ]
+                    continue
+                if total > max_decisions:
+                    logging.warning(
+                        f"{total} decisions updated from {start_date} to "
+                        f"{end_date}, only {max_decisions} can be exported"
+                    )
+                self.windows.append(
+                    {
+                        "start_date": start_date,
+                        "end_date": end_date,
+                        "total": total,
+                        "n_decisions": None,
+                        "fetched": False,
+                    }
+                )
+            self.pending = pending
+
+    def merge(self, max_decisions: int = MAX_EXPORT_DECISIONS):
+        """Merges the consecutive windows not fetched yet"""
+        with self._lock:
+            windows = sorted(self.windows, key=lambda window: window["start_date"])
+            fetched = [window for window in windows if window["fetched"]]
+            merged = []
+            run = []
+            for window in windows + [None]:
+                if window is None or window["fetched"]:
+                    merged += merge_windows(run, max_decisions=max_decisions)
+                    run = []
+                else:
+                    run.append(window)
+            self.windows = sorted(
+                fetched + merged, key=lambda window: window["start_date"]
+            )
+
+    def get_windows_to_fetch(self):
+        with self._lock:
+            return [dict(window) for window in self.windows if not window["fetched"]]
+
+    def set_fetched(self, start_date: str, n_decisions: int):
+        with self._lock:
+            for window in self.windows:
+                if window["start_date"] == start_date:
+                    window["fetched"] = True
+                    window["n_decisions"] = n_decisions
+
+
+def backfill(
+    jurisdiction: str,
+    start_date: datetime.date = FIRST_DATE,
+    end_date: datetime.date = None,
+    output_path: str = "data/raw_data",
+    headers: dict = PISTE_API_HEADERS,
+    base_url: str = PISTE_API_URL,
+    max_workers: int = 4,
+    max_requests: int = None,
+    max_decisions: int = MAX_EXPORT_DECISIONS,
+):
+    """Downloads the decisions of a jurisdiction updated between two dates, one
+    parquet file per window of update dates.
+
+    The windows adapt to the number of decisions: the period is counted first,
+    with a request per window, and the windows above the export limit are
+    split, proportionally to their number of decisions, then counted again.
+    Consecutive windows whose decisions fit in a single export are merged, and
+    the windows are downloaded. Counts and downloads are sent by `max_workers`
+    threads, and at most `max_requests` requests are sent.
+
+    The progress is recorded in the state file of the jurisdiction, so that an
+    interrupted backfill, or one that used its whole budget, resumes with the
+    windows left, even on a later day: without `end_date`, it is extended to
+    today. Returns whether the backfill is complete.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    state = BackfillState(
+        get_state_file(output_path, jurisdiction), jurisdiction, start_date, end_date
+    )
+    budget = RequestBudget(max_requests)
+
+    def count(window):
+        if not budget.reserve(1):
+            return None
+        return get_export_total(*window, jurisdiction=jurisdiction, client=client)
+
+    def fetch(window):
+        total = window["total"]
+        if total == 0:
+            n_decisions = 0
+        elif not budget.reserve(
+            math.ceil(min(total, max_decisions) / EXPORT_BATCH_SIZE)
+        ):
+            return False
+        else:
+            n_decisions = write_export_to_parquet(
+                filename=get_window_file(
+                    output_path, jurisdiction, window["start_date"], window["end_date"]
+                ),
+                start_date=window["start_date"],
+                end_date=window["end_date"],
+                jurisdiction=jurisdiction,
+                client=client,
+            )
+        state.set_fetched(window["start_date"], n_decisions)
+        state.save()
+        return True
+
+    with PisteClient(
+        base_url=base_url, headers=headers, pool_size=max_workers
+    ) as client, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while state.pending:
+            windows = [tuple(window) for window in state.pending]
+            logging.info(
+                f"Counting the {jurisdiction} decisions of {len(windows)} windows"
+            )
+            counts = dict(zip(windows, executor.map(count, windows)))
+            state.add_counts(
+                {
+                    window: total
+                    for window, total in counts.items()
+                    if total is not None
+                },
+                max_decisions=max_decisions,
+            )
+            state.save()
+            if None in counts.values():
+                break
+
+        # windows are only merged and downloaded once the period is counted
+        if not state.pending:
+            state.merge(max_decisions=max_decisions)
+            state.save()
+
+            windows = state.get_windows_to_fetch()
+            logging.info(f"Downloading {len(windows)} windows of {jurisdiction} data")
+            list(executor.map(fetch, windows))
+
+        logging.info(f"API client statistics: {client.stats()}")
+
+    is_complete = not state.pending and not state.get_windows_to_fetch()
+    if not is_complete:
+        logging.info(
+            f"Request budget used, {len(state.pending)} windows left to count and "
+            f"{len(state.get_windows_to_fetch())} to download"
+        )
+    return is_complete
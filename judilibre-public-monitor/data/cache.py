@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+
+from .materialize_data import is_cube_up_to_date
+from .materialize_data import load_cube
+from .materialize_data import materialize_data
+
+
+def get_files_identity(filenames: list[str], hash_content: bool = False):
+    """Returns a tuple identifying the current state of the given files"""
+    identity = []
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            identity.append((filename, None, None, None))
+            continue
+
+        digest = None
+        if hash_content:
+            file_hash = hashlib.blake2b(digest_size=16)
+            with open(filename, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    file_hash.update(chunk)
+            digest = file_hash.hexdigest()
+
+        identity.append((filename, stat.st_size, stat.st_mtime_ns, digest))
+
+    return tuple(identity)
+
+
+def get_identity_version(identity: tuple):
+    """Returns a short string version computed from a files identity"""
+    return hashlib.blake2b(repr(identity).encode(), digest_size=8).hexdigest()
+
+
+class DataCache:
+    """Thread-safe cache of the materialized cube, reloaded when it changes.
+
+    The cube is materialized from the decisions if it is missing or has an
+    outdated schema version.
+    """
+
+    def __init__(
+        self,
+        path: str = ".",
+        main_filename: str = "full_data.parquet",
+        nac_reference_filename: str = "nac_reference.csv",
+        cube_filename: str = "cube.parquet",
+        hash_content: bool = False,
+        check_interval: float = 1.0,
+    ):
+        self.path = path
+        self.main_filename = main_filename
+        self.nac_reference_filename = nac_reference_filename
+        self.cube_filename = cube_filename
+        self.hash_content = hash_content
+        self.check_interval = check_interval
+
+        self._lock = threading.RLock()
+        self._df = None
+        self._identity = None
+        self._version = None
+        self._last_check = 0.0
+        self._derived = {}
+        self._derived_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.last_reload_time = None
+        self.total_reload_time = 0.0
+        self.n_bytes = None
+        # durations of the stages of the last materialization of the cube
+        self.load_timings = {}
+
+    @property
+    def filenames(self):
+        return [os.path.join(self.path, self.cube_filename)]
+
+    @property
+    def version(self):
+        return self._version
+
+    def _get_identity(self):
+        return get_files_identity(self.filenames, hash_content=self.hash_content)
+
+    def _is_fresh(self):
+        if self._df is None:
+            return False
+
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return True
+
+        self._last_check = now
+        return self._get_identity() == self._identity
+
+    def _reload(self):
+        start = time.perf_counter()
+
+        if not is_cube_up_to_date(os.path.join(self.path, self.cube_filename)):
+            materialize_data(
+                path=self.path,
+                main_filename=self.main_filename,
+                nac_reference_filename=self.nac_reference_filename,
+                cube_filename=self.cube_filename,
+                timings=self.load_timings,
+            )
+
+        identity = self._get_identity()
+        df = load_cube(path=self.path, cube_filename=self.cube_filename)
+        duration = time.perf_counter() - start
+
+        self._df = df
+        self._identity = identity
+        self._version = get_identity_version(identity)
+        self._last_check = time.monotonic()
+        self.n_bytes = int(df.memory_usage(deep=True).sum())
+
+        self.reloads += 1
+        self.last_reload_time = duration
+        self.total_reload_time += duration
+
+        logging.info(
+            f"Loaded data version {self._version} "
+            f"({df.shape[0]} lines) in {duration:.3f}s"
+        )
+
+    def get(self) -> pd.DataFrame:
+        """Returns the cached data, reloading it if the files have changed.
+
+        The returned DataFrame is shared between callers and must not be
+        modified in place.
+        """
+        with self._lock:
+            if self._is_fresh():
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._reload()
+            return self._df
+
+    def get_versioned(self):
+        """Returns the cached data along with its version"""
+        with self._lock:
+            df = self.get()
+            return df, self._version
+
+    def get_derived(self, name: str, compute):
+        """Returns `compute(df)`, computed once per version of the data.
+
+        The first caller computes the value outside of the lock, so it may use
+        the cache, and concurrent callers wait for it instead of computing it
+        again. A failed computation is attempted again by the next caller.
+        """
+        with self._lock:
+            df, version = self.get_versioned()
+            if self._derived_version != version:
+                self._derived = {}
+                self._derived_version = version
+            future = self._derived.get(name)
+            is_computing = future is None
+            if is_computing:
+                future = self._derived[name] = Future()
+
+        if is_computing:
+            try:
+                future.set_result(compute(df))
+            except BaseException as e:
+                with self._lock:
+                    if self._derived.get(name) is future:
+                        del self._derived[name]
+                future.set_exception(e)
+                raise
+        return future.result()
+
+    def invalidate(self):
+        with self._lock:
+            self._derived = {}
+            self._derived_version = None
+            self._df = None
+            self._identity = None
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            n_requests = self.hits + self.misses
+            return {
+                "version": self._version,
+                "bytes": self.n_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / n_requests if n_requests else None,
+                "reloads": self.reloads,
+                "last_reload_time": self.last_reload_time,
+                "total_reload_time": self.total_reload_time,
+                "load_timings": dict(self.load_timings),
+            }
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_data_cache(path: str = ".", **kwargs) -> DataCache:
+    """Returns the process-wide cache associated with a data folder"""
+    key = (os.path.abspath(path), tuple(sorted(kwargs.items())))
+    with _CACHES_LOCK:
+        if key not in _CACHES:
+            _CACHES[key] = DataCache(path=path, **kwargs)
+        return _CACHES[key]
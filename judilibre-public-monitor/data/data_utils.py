@@ -138,6 +138,20 @@ TYPES = {
 
 SOURCES = {"dila": "DILA", "jurinet": "Jurinet", "jurica": "Jurica"}
 
+# categories of the cleaned dimensions, sorted so that grouping on them keeps
+# the alphabetical order of the former object columns
+UNKNOWN = "Non renseigné"
+COURT_CC = "Cour de casation"
+
+CLEAN_SOURCES_DTYPE = CategoricalDtype(sorted({*SOURCES.values(), "Autre"}))
+CLEAN_JURISDICTIONS_DTYPE = CategoricalDtype(sorted({*JURISDICTIONS.values(), UNKNOWN}))
+CLEAN_TYPES_DTYPE = CategoricalDtype(sorted({*TYPES.values(), "Autre"}))
+COURTS_DTYPE = CategoricalDtype(sorted({*LOCATIONS.values(), UNKNOWN, COURT_CC}))
+CLEAN_LOCATIONS_DTYPE = CategoricalDtype(
+    sorted({remove_cour_dappel(court) for court in COURTS_DTYPE.categories})
+)
+FORMATIONS_DTYPE = CategoricalDtype(sorted({*FORMATIONS_CC.values(), UNKNOWN}))
+
 
 CLEAN_COLUMN_NAMES = {
     "formation_clean": "Chambre ou formation",
@@ -0,0 +1,557 @@
+import datetime
+import glob
+import json
+import logging
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .download_utils import DEFAULT_KEYS
+from .id_index import ID_INDEX_DIRNAME
+from .id_index import IdIndex
+from .id_index import INDEX_VERSION
+from .id_index import to_bytes_array
+
+DECISIONS_SCHEMA = pa.schema([(key, pa.string()) for key in DEFAULT_KEYS])
+
+# decisions downloaded after the main file are appended to this folder, in
+# partitions such as decisions/jurisdiction=ca/update_month=2023-05/
+DATASET_DIRNAME = "decisions"
+UNKNOWN_PARTITION = "unknown"
+
+# ids of the decisions of the main file superseded by a newer version in the
+# partitions, skipped when reading the main file
+SUPERSEDED_FILENAME = "superseded_ids.parquet"
+
+# files replaced by new ones and the new files, written before the new files so
+# that an interrupted replacement never leaves both sets in the dataset
+REPLACEMENT_FILENAME = "replacement.json"
+
+# files are sorted by jurisdiction and decision date, so that the statistics of
+# their row groups let readers skip the ones outside of a filter
+SORT_ORDER = ["jurisdiction", "decision_date"]
+ROW_GROUP_SIZE = 100_000
+
+
+def get_partition_path(dataset_path: str, jurisdiction: str, update_month: str):
+    return os.path.join(
+        dataset_path, f"jurisdiction={jurisdiction}", f"update_month={update_month}"
+    )
+
+
+def new_part_name():
+    return (
+        f"part-{datetime.datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}.parquet"
+    )
+
+
+def list_partition_files(partition_path: str):
+    return sorted(glob.glob(os.path.join(partition_path, "part-*.parquet")))
+
+
+def list_partitions(dataset_path: str):
+    return sorted(
+        glob.glob(os.path.join(dataset_path, "jurisdiction=*", "update_month=*"))
+    )
+
+
+def get_replacement_file(dataset_path: str):
+    return os.path.join(dataset_path, REPLACEMENT_FILENAME)
+
+
+def start_replacement(
+    dataset_path: str, replaced_files: list[str], new_files: list[str]
+):
+    """Records that `replaced_files` are about to be replaced by `new_files`,
+    before any of them is written. A former replacement is finished first."""
+    finish_replacement(dataset_path)
+    os.makedirs(dataset_path, exist_ok=True)
+    replacement_file = get_replacement_file(dataset_path)
+    temporary_file = os.path.join(dataset_path, f".{REPLACEMENT_FILENAME}.tmp")
+    with open(temporary_file, "w") as f:
+        json.dump(
+            {
+                "replaced": [
+                    os.path.relpath(name, dataset_path) for name in replaced_files
+                ],
+                "new": [os.path.relpath(name, dataset_path) for name in new_files],
+            },
+            f,
+        )
+    os.replace(temporary_file, replacement_file)
+
+
+def get_skipped_files(dataset_path: str):
+    """Returns the files to skip because of an unfinished replacement: the
+    replaced files once all the new ones are written, the new ones otherwise"""
+    replacement_file = get_replacement_file(dataset_path)
+    if not os.path.exists(replacement_file):
+        return set()
+    with open(replacement_file) as f:
+        replacement = json.load(f)
+
+    replaced_files, new_files = (
+        [os.path.normpath(os.path.join(dataset_path, f)) for f in replacement[key]]
+        for key in ["replaced", "new"]
+    )
+    if all(os.path.exists(f) for f in new_files):
+        return set(replaced_files)
+    return set(new_files)
+
+
+def finish_replacement(dataset_path: str):
+    """Removes the files skipped because of an unfinished replacement, then the
+    record of the replacement"""
+    for f in get_skipped_files(dataset_path):
+        try:
+            os.remove(f)
+        except FileNotFoundError:
+            pass
+    try:
+        os.remove(get_replacement_file(dataset_path))
+    except FileNotFoundError:
+        pass
+
+
+def list_dataset_files(
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    dataset_dirname: str = DATASET_DIRNAME,
+):
+    """Lists the files of the logical dataset: the main file, unless
+    `main_filename` is None, then the partitions. The files skipped because of
+    an unfinished replacement are left out."""
+    dataset_path = os.path.join(path, dataset_dirname)
+    files = []
+
+    if main_filename is not None:
+        main_file = os.path.join(path, main_filename)
+        if os.path.exists(main_file):
+            files.append(main_file)
+
+    for partition_path in list_partitions(dataset_path):
+        files += list_partition_files(partition_path)
+
+    skipped_files = get_skipped_files(dataset_path)
+    return [f for f in files if os.path.normpath(f) not in skipped_files]
+
+
+def get_decisions_dataset(
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    dataset_dirname: str = DATASET_DIRNAME,
+):
+    """Returns the main file and the appended partitions as a single dataset"""
+    files = list_dataset_files(
+        path=path, main_filename=main_filename, dataset_dirname=dataset_dirname
+    )
+    return ds.dataset(files, schema=DECISIONS_SCHEMA, format="parquet")
+
+
+def get_decisions_filter(
+    jurisdictions: list[str] = None, start_date=None, end_date=None
+):
+    """Returns the dataset expression keeping the decisions of some
+    jurisdictions rendered between two dates, both included, or None"""
+    conditions = []
+    if jurisdictions is not None:
+        conditions.append(pc.field("jurisdiction").isin(jurisdictions))
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date).strftime("%Y-%m-%d")
+        conditions.append(pc.field("decision_date") >= start_date)
+    if end_date is not None:
+        # dates are strings, possibly followed by a time
+        end_date = (pd.Timestamp(end_date) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        conditions.append(pc.field("decision_date") < end_date)
+
+    if not conditions:
+        return None
+
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def get_superseded_file(path: str = ".", dataset_dirname: str = DATASET_DIRNAME):
+    return os.path.join(path, dataset_dirname, SUPERSEDED_FILENAME)
+
+
+def read_superseded_ids(path: str = ".", dataset_dirname: str = DATASET_DIRNAME):
+    """Returns the ids of the decisions of the main file superseded by a newer
+    version, or None if there are none"""
+    superseded_file = get_superseded_file(path=path, dataset_dirname=dataset_dirname)
+    if not os.path.exists(superseded_file):
+        return None
+    return pq.read_table(superseded_file)["id"].combine_chunks()
+
+
+def add_superseded_ids(
+    ids: list[str], path: str = ".", dataset_dirname: str = DATASET_DIRNAME
+):
+    ids = pa.array(ids, type=pa.string())
+    superseded_ids = read_superseded_ids(path=path, dataset_dirname=dataset_dirname)
+    if superseded_ids is not None:
+        ids = pa.concat_arrays([superseded_ids, ids])
+    table = pa.table({"id": pc.unique(ids)})
+
+    superseded_file = get_superseded_file(path=path, dataset_dirname=dataset_dirname)
+    os.makedirs(os.path.dirname(superseded_file), exist_ok=True)
+    temporary_file = os.path.join(
+        os.path.dirname(superseded_file), f".{SUPERSEDED_FILENAME}.tmp"
+    )
+    pq.write_table(table, temporary_file)
+    os.replace(temporary_file, superseded_file)
+
+
+def read_decisions(
+    path: str = ".",
+    columns: list[str] = None,
+    main_filename: str = "full_data.parquet",
+    dataset_dirname: str = DATASET_DIRNAME,
+    filter: ds.Expression = None,
+) -> pd.DataFrame:
+    """Reads the `columns` of the decisions kept by `filter`.
+
+    Only the projected columns are read, and the row groups whose statistics
+    do not match the filter are skipped. The versions of the main file
+    superseded by newer ones are skipped as well.
+    """
+    superseded_ids = read_superseded_ids(path=path, dataset_dirname=dataset_dirname)
+    main_file = os.path.join(path, main_filename)
+    files = list_dataset_files(
+        path=path, main_filename=main_filename, dataset_dirname=dataset_dirname
+    )
+    if superseded_ids is None or main_file not in files:
+        dataset = ds.dataset(files, schema=DECISIONS_SCHEMA, format="parquet")
+        return dataset.to_table(columns=columns, filter=filter).to_pandas()
+
+    # only the main file is filtered by id, partitions holding the newer versions
+    is_current = ~pc.field("id").isin(superseded_ids)
+    main_table = ds.dataset(
+        main_file, schema=DECISIONS_SCHEMA, format="parquet"
+    ).to_table(
+        columns=columns,
+        filter=is_current if filter is None else filter & is_current,
+    )
+    partition_files = [f for f in files if f != main_file]
+    partitions_table = ds.dataset(
+        partition_files, schema=DECISIONS_SCHEMA, format="parquet"
+    ).to_table(columns=columns, filter=filter)
+    return pa.concat_tables([main_table, partitions_table]).to_pandas()
+
+
+def get_max_update_date(
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    dataset_dirname: str = DATASET_DIRNAME,
+    jurisdiction: str = None,
+):
+    """Returns the latest update date of the decisions, of a jurisdiction if
+    given, or None if there are none"""
+    dataset = get_decisions_dataset(
+        path=path, main_filename=main_filename, dataset_dirname=dataset_dirname
+    )
+    filter = None if jurisdiction is None else pc.field("jurisdiction") == jurisdiction
+    update_dates = dataset.to_table(columns=["update_date"], filter=filter)
+    max_date = pc.max(update_dates["update_date"]).as_py()
+    return None if max_date is None else pd.to_datetime(max_date)
+
+
+def get_main_file_source(path: str = ".", main_filename: str = "full_data.parquet"):
+    """Returns the size and modification time of the main file, which is only
+    replaced as a whole, or None if there is none"""
+    main_file = os.path.join(path, main_filename)
+    if not os.path.exists(main_file):
+        return None
+    stat = os.stat(main_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def get_id_index(
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    dataset_dirname: str = DATASET_DIRNAME,
+):
+    """Returns the index of the ids of the dataset and of the update date of
+    their latest version.
+
+    The index is built from the dataset if it is missing, of a former version
+    or if the main file was replaced since, then kept up to date by
+    `upsert_decisions`. As both write the index, they must only run in the
+    process refreshing the data, under its lock: other processes use
+    `open_id_index`.
+    """
+    index = IdIndex(os.path.join(path, ID_INDEX_DIRNAME))
+    source = get_main_file_source(path=path, main_filename=main_filename)
+    if not index.is_up_to_date(source=source):
+        dataset = get_decisions_dataset(
+            path=path, main_filename=main_filename, dataset_dirname=dataset_dirname
+        )
+        index.build(
+            (
+                (
+                    batch["id"].to_numpy(zero_copy_only=False),
+                    pc.fill_null(batch["update_date"], "").to_numpy(
+                        zero_copy_only=False
+                    ),
+                )
+                for batch in dataset.to_batches(columns=["id", "update_date"])
+            ),
+            source=source,
+        )
+    return index
+
+
+def open_id_index(path: str = "."):
+    """Returns the id index of the dataset without ever building or updating
+    it, or None if it is not built yet"""
+    index = IdIndex(os.path.join(path, ID_INDEX_DIRNAME))
+    if not index.exists() or index.read_manifest().get("version") != INDEX_VERSION:
+        return None
+    return index
+
+
+def write_parquet_file(df: pd.DataFrame, filename: str):
+    """Writes decisions to a parquet file sorted by `SORT_ORDER`, replacing it
+    atomically"""
+    table = pa.Table.from_pandas(
+        df[DECISIONS_SCHEMA.names], schema=DECISIONS_SCHEMA, preserve_index=False
+    )
+    table = table.sort_by([(column, "ascending") for column in SORT_ORDER])
+    temporary_file = os.path.join(
+        os.path.dirname(filename), f".{os.path.basename(filename)}.tmp"
+    )
+    pq.write_table(table, temporary_file, row_group_size=ROW_GROUP_SIZE)
+    os.replace(temporary_file, filename)
+
+
+def get_update_months(update_dates: pd.Series):
+    return update_dates.astype("string").str.slice(0, 7).fillna(UNKNOWN_PARTITION)
+
+
+def group_partitions(df: pd.DataFrame):
+    """Groups decisions by the jurisdiction and update month of their partition"""
+    return df.groupby(
+        [
+            df["jurisdiction"].fillna(UNKNOWN_PARTITION),
+            get_update_months(df["update_date"]),
+        ]
+    )
+
+
+def write_partitions(df: pd.DataFrame, dataset_path: str, part_name: str = None):
+    """Writes decisions as new files in their partitions, all named `part_name`"""
+    df = df.astype({key: "string" for key in DECISIONS_SCHEMA.names})
+    partitions = group_partitions(df)
+    part_name = part_name or new_part_name()
+
+    for (jurisdiction, update_month), df_partition in partitions:
+        partition_path = get_partition_path(dataset_path, jurisdiction, update_month)
+        os.makedirs(partition_path, exist_ok=True)
+        write_parquet_file(df_partition, os.path.join(partition_path, part_name))
+
+    return partitions.ngroups
+
+
+def keep_latest_versions(df: pd.DataFrame):
+    """Keeps the version of each decision with the latest update date"""
+    df = df.sort_values("update_date", kind="stable", na_position="first")
+    return df.drop_duplicates(subset=["id"], keep="last")
+
+
+def remove_superseded_versions(
+    df: pd.DataFrame, path: str = ".", dataset_dirname: str = DATASET_DIRNAME
+):
+    """Removes the versions of decisions superseded by newer ones, given their
+    id, jurisdiction and update date.
+
+    A version appended after the main file is in the partition of its
+    jurisdiction and update month, which is rewritten without it. The other
+    versions are in the main file, which is not rewritten: their ids are
+    recorded to be skipped when reading it.
+    """
+    dataset_path = os.path.join(path, dataset_dirname)
+    in_partitions = []
+
+    partitions = group_partitions(df)
+    for (jurisdiction, update_month), df_partition in partitions:
+        partition_path = get_partition_path(dataset_path, jurisdiction, update_month)
+        files = list_partition_files(partition_path)
+        if not files:
+            continue
+        partition_ids = ds.dataset(
+            files, schema=DECISIONS_SCHEMA, format="parquet"
+        ).to_table(columns=["id"])["id"]
+        superseded_ids = df_partition.loc[
+            df_partition["id"].isin(partition_ids.to_numpy()), "id"
+        ]
+        if not superseded_ids.empty:
+            compact_partition(partition_path, removed_ids=superseded_ids.tolist())
+            in_partitions += superseded_ids.tolist()
+
+    in_main_file = df.loc[~df["id"].isin(in_partitions), "id"]
+    if not in_main_file.empty:
+        add_superseded_ids(
+            in_main_file.tolist(), path=path, dataset_dirname=dataset_dirname
+        )
+
+
+def upsert_decisions(
+    df: pd.DataFrame,
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    dataset_dirname: str = DATASET_DIRNAME,
+):
+    """Appends the decisions that are not in the dataset yet or whose update
+    date is newer than the one of the version in the dataset, which is removed.
+
+    The versions in the dataset are looked up in the id index, so that the work
+    depends on the number of given decisions and not on the size of the
+    dataset. Superseded versions are removed before the new ones are written,
+    and the index is updated last: if interrupted, the decisions are considered
+    as new again by the next update. Returns the number of written decisions.
+    """
+    df = keep_latest_versions(df)
+    finish_replacement(os.path.join(path, dataset_dirname))
+
+    index = get_id_index(
+        path=path, main_filename=main_filename, dataset_dirname=dataset_dirname
+    )
+    is_known, known_dates = index.lookup(df["id"])
+    update_dates = to_bytes_array(df["update_date"].fillna(""))
+    # unknown decisions are new even without an update date
+    is_newer = ~is_known | (update_dates > known_dates)
+    df = df[is_newer]
+
+    if df.empty:
+        return 0
+
+    is_superseded = is_known[is_newer]
+    superseded_dates = pd.Series(
+        known_dates[is_newer][is_superseded].astype(str), dtype="string"
+    ).replace("", pd.NA)
+    if is_superseded.any():
+        remove_superseded_versions(
+            df.loc[is_superseded, ["id", "jurisdiction"]]
+            .reset_index(drop=True)
+            .assign(update_date=superseded_dates),
+            path=path,
+            dataset_dirname=dataset_dirname,
+        )
+
+    n_partitions = write_partitions(df, os.path.join(path, dataset_dirname))
+    index.upsert(df["id"], update_dates[is_newer])
+
+    logging.info(
+        f"Wrote {df.shape[0]} decisions to {n_partitions} partitions, "
+        f"{is_superseded.sum()} of them superseding a former version"
+    )
+
+    return df.shape[0]
+
+
+def compact_partition(partition_path: str, removed_ids: list[str] = None):
+    """Merges the files of a partition into a single one, keeping the latest
+    version of each decision and removing the decisions of `removed_ids`"""
+    files = list_partition_files(partition_path)
+    if len(files) < 2 and removed_ids is None:
+        return
+
+    df = ds.dataset(files, schema=DECISIONS_SCHEMA, format="parquet").to_table()
+    df = keep_latest_versions(df.to_pandas())
+    if removed_ids is not None:
+        df = df[~df["id"].isin(removed_ids)]
+
+    # the compacted file is a new part, named after the files it replaces, so
+    # that an interrupted compaction can be told apart from a finished one. No
+    # file replaces a partition whose decisions were all removed.
+    dataset_path = os.path.dirname(os.path.dirname(partition_path))
+    compacted_file = os.path.join(partition_path, new_part_name())
+    start_replacement(dataset_path, files, [] if df.empty else [compacted_file])
+    if not df.empty:
+        write_parquet_file(df, compacted_file)
+    finish_replacement(dataset_path)
+
+    logging.info(f"Compacted {len(files)} files in {partition_path}")
+
+
+def compact_decisions(
+    path: str = ".",
+    dataset_dirname: str = DATASET_DIRNAME,
+    max_files_per_partition: int = 1,
+):
+    """Compacts the partitions having more than `max_files_per_partition` files"""
+    dataset_path = os.path.join(path, dataset_dirname)
+    finish_replacement(dataset_path)
+    for partition_path in list_partitions(dataset_path):
+        if len(list_partition_files(partition_path)) > max_files_per_partition:
+            compact_partition(partition_path)
+
+
+def partition_main_file(
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    dataset_dirname: str = DATASET_DIRNAME,
+):
+    """Moves the decisions of the main file to the partitioned dataset"""
+    main_file = os.path.join(path, main_filename)
+    dataset_path = os.path.join(path, dataset_dirname)
+    finish_replacement(dataset_path)
+
+    df = read_decisions(
+        path=path, main_filename=main_filename, dataset_dirname=dataset_dirname
+    )
+    df = keep_latest_versions(df)
+
+    # writing the whole dataset to new files before removing the former ones,
+    # including the superseded versions, left out of the new files
+    former_files = list_dataset_files(
+        path=path, main_filename=main_filename, dataset_dirname=dataset_dirname
+    )
+    superseded_file = get_superseded_file(path=path, dataset_dirname=dataset_dirname)
+    if os.path.exists(superseded_file):
+        former_files.append(superseded_file)
+    part_name = new_part_name()
+    new_files = [
+        os.path.join(get_partition_path(dataset_path, jurisdiction, month), part_name)
+        for jurisdiction, month in group_partitions(df).groups
+    ]
+    start_replacement(dataset_path, former_files, new_files)
+    write_partitions(df, dataset_path, part_name=part_name)
+    finish_replacement(dataset_path)
+
+    logging.info(f"Partitioned {df.shape[0]} decisions from {main_file}")
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument(
+        "-p", "--path", default="./data", help="Folder containing the data"
+    )
+    argument_parser.add_argument(
+        "--partition-main-file",
+        action="store_true",
+        help="Move the decisions of the main file to the partitioned dataset",
+    )
+    argument_parser.add_argument(
+        "-v", "--verbose", help="Debug level of verbose", action="store_true"
+    )
+
+    arguments = argument_parser.parse_args()
+
+    if arguments.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    if arguments.partition_main_file:
+        partition_main_file(path=arguments.path)
+    else:
+        compact_decisions(path=arguments.path)
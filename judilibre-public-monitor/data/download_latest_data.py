@@ -1,69 +1,226 @@
 import datetime
+import glob
 import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
-from .download_utils import download_data_between_update_dates
+from .dataset import compact_decisions
+from .dataset import get_max_update_date
+from .dataset import upsert_decisions
+from .download_utils import get_export_schema
+from .download_utils import iter_export_batches
+from .ingest_manifest import IngestManifest
+from .ingest_manifest import LOOKBACK_DAYS
+from .piste_client import PisteClient
 
+JURISDICTIONS = ["ca", "cc"]
 
-def download_latest_data(
-    reference_file: str = "./full_data.parquet",
-    target_file: str = "./updated_data.parquet",
-    api_key_id: str = "XXXXXX",
-    api_url: str = "https://sandbox-api.piste.gouv.fr/cassation/judilibre/v1.0",
-):
-    df = pd.read_parquet(reference_file)
-    logging.info(f"Initial data has {df.shape[0]} lines")
+# batches of the windows being downloaded are written to this folder, until
+# their decisions are written to the dataset
+INGEST_DIRNAME = "ingest"
 
-    max_date = pd.to_datetime(df["update_date"]).max()
 
-    today = datetime.datetime.now()
+def get_window_path(path: str, jurisdiction: str, start_date, end_date):
+    return os.path.join(path, INGEST_DIRNAME, f"{jurisdiction}_{start_date}_{end_date}")
 
-    n_days = int((today - max_date) / datetime.timedelta(days=1)) + 1
-    if n_days == 1:
-        logging.info("No new data to download")
-        return
 
-    dates = [
-        (max_date + datetime.timedelta(days=i)).date() for i in range(-2, n_days + 1)
-    ]
+def get_windows(
+    manifest: IngestManifest,
+    jurisdiction: str,
+    today: datetime.date,
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+):
+    """Returns the daily windows of update dates to download for a
+    jurisdiction, from a little before its watermark to today, except the
+    windows already complete"""
+    watermark = manifest.get_watermark(jurisdiction)
+    if watermark is None:
+        # without a manifest yet, the dataset is read once
+        max_date = get_max_update_date(
+            path=path, main_filename=main_filename, jurisdiction=jurisdiction
+        )
+        if max_date is None:
+            logging.warning(f"No {jurisdiction} decisions, downloading from today")
+            watermark = today
+        else:
+            watermark = max_date.date()
+        manifest.set_watermark(jurisdiction, watermark)
+    logging.info(f"Latest {jurisdiction} update date is {watermark}")
 
-    data = []
+    start_date = watermark - datetime.timedelta(days=LOOKBACK_DAYS)
+    windows = []
+    for i in range((today - start_date).days + 1):
+        window = (
+            start_date + datetime.timedelta(days=i),
+            start_date + datetime.timedelta(days=i + 1),
+        )
+        if not manifest.is_complete(jurisdiction, *window):
+            windows.append(window)
+    return windows
 
-    start_end = list(zip(dates[:-1], dates[1:]))
 
-    for start_date, end_date in start_end:
-        logging.info(f"Downloading data from {start_date} to {end_date}")
+def fetch_window(
+    manifest: IngestManifest,
+    jurisdiction: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    path: str = ".",
+    client: PisteClient = None,
+):
+    """Writes the batches of a window to its folder, one file per batch,
+    resuming after the last batch recorded by the manifest"""
+    window_path = get_window_path(path, jurisdiction, start_date, end_date)
 
-        result = download_data_between_update_dates(
-            base_url=api_url,
-            headers={"KeyId": api_key_id},
+    first_batch = manifest.start_window(jurisdiction, start_date, end_date)
+    if first_batch == 0:
+        shutil.rmtree(window_path, ignore_errors=True)
+        logging.info(f"Downloading {jurisdiction} data from {start_date} to {end_date}")
+    else:
+        logging.info(
+            f"Resuming {jurisdiction} data from {start_date} to {end_date} "
+            f"at batch {first_batch}"
+        )
+    os.makedirs(window_path, exist_ok=True)
+
+    for i, batch in enumerate(
+        iter_export_batches(
             start_date=start_date,
             end_date=end_date,
-            jurisdiction="ca",
+            jurisdiction=jurisdiction,
+            client=client,
+            first_batch=first_batch,
+        ),
+        start=first_batch,
+    ):
+        batch_file = os.path.join(window_path, f"batch-{i:05d}.parquet")
+        temporary_file = os.path.join(window_path, f".batch-{i:05d}.parquet.tmp")
+        pq.write_table(batch, temporary_file)
+        os.replace(temporary_file, batch_file)
+        manifest.add_batch(jurisdiction, start_date, end_date, batch)
+
+    manifest.finish_window(jurisdiction, start_date, end_date)
+
+
+def ingest_windows(
+    manifest: IngestManifest,
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+):
+    """Upserts the decisions of the fetched windows in the dataset, then moves
+    the watermarks forward.
+
+    If interrupted, the windows are ingested again by the next download, which
+    upserts the same decisions. Returns the number of new or updated decisions.
+    """
+    windows = manifest.get_fetched_windows()
+    if not windows:
+        return 0
+
+    tables = []
+    for window in windows:
+        window_path = get_window_path(
+            path, window["jurisdiction"], window["start_date"], window["end_date"]
         )
+        files = sorted(glob.glob(os.path.join(window_path, "batch-*.parquet")))
+        tables.append(
+            ds.dataset(files, schema=get_export_schema(), format="parquet").to_table()
+        )
+    table = pa.concat_tables(tables)
 
-        data.append(pd.DataFrame(result))
+    n_new_decisions = 0
+    if table.num_rows:
+        n_new_decisions = upsert_decisions(
+            table.to_pandas(), path=path, main_filename=main_filename
+        )
 
-        result = download_data_between_update_dates(
-            base_url=api_url,
-            headers={"KeyId": api_key_id},
-            start_date=start_date,
-            end_date=end_date,
-            jurisdiction="cc",
+    for jurisdiction in JURISDICTIONS:
+        update_dates = pa.concat_arrays(
+            [
+                t["update_date"].combine_chunks()
+                for t, window in zip(tables, windows)
+                if window["jurisdiction"] == jurisdiction
+            ]
+            or [pa.array([], type=pa.string())]
         )
+        max_date = pc.max(update_dates).as_py()
+        if max_date is not None:
+            manifest.set_watermark(
+                jurisdiction, datetime.date.fromisoformat(max_date[:10])
+            )
+
+    manifest.set_ingested(windows)
+    for window in windows:
+        shutil.rmtree(
+            get_window_path(
+                path, window["jurisdiction"], window["start_date"], window["end_date"]
+            ),
+            ignore_errors=True,
+        )
+
+    return n_new_decisions
+
+
+def download_latest_data(
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    api_key_id: str = "XXXXXX",
+    api_url: str = "https://sandbox-api.piste.gouv.fr/cassation/judilibre/v1.0",
+    max_files_per_partition: int = 8,
+    max_workers: int = 4,
+):
+    """Upserts the decisions updated since the latest update date in the dataset
 
-        data.append(pd.DataFrame(result))
+    The progress is recorded by the ingest manifest: the latest update date of
+    each jurisdiction is read from it, windows already complete are skipped,
+    and the windows of an interrupted download are resumed from their last
+    batch. Returns the number of new or updated decisions.
+    """
+    manifest = IngestManifest(path=path)
 
-    df_new = pd.concat(data)
+    # windows fetched by an interrupted download
+    n_new_decisions = ingest_windows(manifest, path=path, main_filename=main_filename)
+    manifest.save()
 
-    df = pd.concat([df, df_new])
+    today = datetime.date.today()
+    tasks = [
+        (jurisdiction, start_date, end_date)
+        for jurisdiction in JURISDICTIONS
+        for start_date, end_date in get_windows(
+            manifest, jurisdiction, today, path=path, main_filename=main_filename
+        )
+    ]
 
-    df = df.drop_duplicates(subset=["id"])
+    with PisteClient(
+        base_url=api_url, headers={"KeyId": api_key_id}, pool_size=max_workers
+    ) as client:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(
+                executor.map(
+                    lambda task: fetch_window(
+                        manifest, *task, path=path, client=client
+                    ),
+                    tasks,
+                )
+            )
+        logging.info(f"API client statistics: {client.stats()}")
 
-    logging.info(f"Final data has {df.shape[0]} lines")
+    n_new_decisions += ingest_windows(manifest, path=path, main_filename=main_filename)
+    manifest.save()
 
-    df.to_parquet(target_file, index=False)
+    logging.info(
+        f"Downloaded {len(tasks)} windows, {n_new_decisions} new or updated decisions"
+    )
+
+    compact_decisions(path=path, max_files_per_partition=max_files_per_partition)
+
+    return n_new_decisions
 
 
 if __name__ == "__main__":
@@ -72,14 +229,14 @@ if __name__ == "__main__":
     argument_parser = ArgumentParser()
 
     argument_parser.add_argument(
-        "-i", "--input-file", default="./full_data.parquet", help="Reference file"
+        "-p",
+        "--path",
+        default=".",
+        help="Folder containing the main file and the partitioned decisions",
     )
 
     argument_parser.add_argument(
-        "-o",
-        "--output-file",
-        default="./update_data.parquet",
-        help="Output file containing old and updated data",
+        "-i", "--input-file", default="full_data.parquet", help="Main file name"
     )
 
     argument_parser.add_argument(
@@ -90,6 +247,13 @@ if __name__ == "__main__":
     )
 
     argument_parser.add_argument("-k", "--api-key", default="XXXXX", help="API key")
+    argument_parser.add_argument(
+        "-w",
+        "--max-workers",
+        default=4,
+        type=int,
+        help="Number of exports downloaded at the same time",
+    )
     argument_parser.add_argument(
         "-v", "--verbose", help="Debug level of verbose", action="store_true"
     )
@@ -100,14 +264,16 @@ if __name__ == "__main__":
         logging.basicConfig(level=logging.INFO)
         logging.info("DEBUG mode:")
 
+    path = arguments.path
     input_file = arguments.input_file
-    output_file = arguments.output_file
     api_url = arguments.url
     api_key = arguments.api_key
+    max_workers = arguments.max_workers
 
     download_latest_data(
-        reference_file=input_file,
-        target_file=output_file,
+        path=path,
+        main_filename=input_file,
         api_key_id=api_key,
         api_url=api_url,
+        max_workers=max_workers,
     )
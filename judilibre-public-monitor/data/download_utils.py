@@ -1,11 +1,14 @@
 import datetime
 import logging
 import os
-import time
 
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
 from dotenv import load_dotenv
 
+from .piste_client import PisteClient
+
 load_dotenv()
 
 PISTE_API_KEY = os.environ.get("PISTE_API_KEY")
@@ -27,72 +30,176 @@ DEFAULT_KEYS = [
 ]
 
 
-def download_data_between_update_dates(
+def get_export_schema(mask: list[str] = DEFAULT_KEYS):
+    return pa.schema([(m, pa.string()) for m in mask])
+
+
+def iter_export_batches(
     start_date: datetime.date,
     end_date: datetime.date,
     jurisdiction: str = "cc",
     headers: str = PISTE_API_HEADERS,
     base_url: str = PISTE_API_URL,
-    timeout: int = 5,
+    timeout: int = 60,
     mask: list[str] = DEFAULT_KEYS,
+    client: PisteClient = None,
+    batch_size: int = 1_000,
+    first_batch: int = 0,
 ):
+    """Yields the decisions of a jurisdiction updated between two dates.
+
+    Each batch of the API is yielded as soon as it is received, as a pyarrow
+    table with one string column per key of `mask`, from the batch
+    `first_batch`. Requests are sent by `client`, or by a new client closed
+    once the export is done. `headers`, `base_url` and `timeout`, the read
+    timeout of each request, only configure that new client: a given `client`
+    keeps its own settings.
+    """
     params = {
         "date_start": str(start_date),
         "date_end": str(end_date),
         "jurisdiction": jurisdiction,
         "date_type": "update",
-        "batch_size": 1_000,
-        "batch": 0,
+        "batch_size": batch_size,
+        "batch": first_batch,
     }
 
-    data = {m: [] for m in mask}
+    schema = get_export_schema(mask)
     n_results = 0
 
     has_next_batch = True
 
-    while has_next_batch:
-        response = requests.get(
-            url=f"{base_url}/export", headers=headers, params=params
-        )
+    own_client = client is None
+    if own_client:
+        client = PisteClient(base_url=base_url, headers=headers, read_timeout=timeout)
 
-        if response.status_code != 200:
-            logging.debug(
-                f"Request received a non 200 status code {response.status_code}"
-            )
-            time.sleep(timeout)
-        else:
-            response_json = response.json()
+    try:
+        while has_next_batch:
+            response_json = client.get("export", params=params)
             has_next_batch = response_json["next_batch"] is not None
 
             results = response_json["results"]
-
-            for r in results:
-                n_results += 1
-                for m in mask:
-                    data[m].append(r.get(m))
+            n_results += len(results)
+
+            yield pa.table(
+                [
+                    pa.array(
+                        [
+                            value
+                            if value is None or isinstance(value, str)
+                            else str(value)
+                            for value in (r.get(m) for r in results)
+                        ],
+                        type=pa.string(),
+                    )
+                    for m in mask
+                ],
+                schema=schema,
+            )
 
             params["batch"] += 1
+    finally:
+        if own_client:
+            client.close()
 
     logging.debug(f"Collected {n_results} decisions from {start_date} to {end_date}")
 
-    return data
 
+def get_export_total(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    jurisdiction: str = "cc",
+    headers: str = PISTE_API_HEADERS,
+    base_url: str = PISTE_API_URL,
+    client: PisteClient = None,
+):
+    """Returns the number of decisions of a jurisdiction updated between two
+    dates, with a single request asking for one decision. `headers` and
+    `base_url` are only used without `client`."""
+    if client is None:
+        with PisteClient(base_url=base_url, headers=headers) as client:
+            return get_export_total(
+                start_date, end_date, jurisdiction=jurisdiction, client=client
+            )
 
-def download_specific_document_by_id(
-    document_id: str,
+    params = {
+        "date_start": str(start_date),
+        "date_end": str(end_date),
+        "jurisdiction": jurisdiction,
+        "date_type": "update",
+        "batch_size": 1,
+        "batch": 0,
+    }
+    return client.get("export", params=params)["total"]
+
+
+def write_export_to_parquet(
+    filename: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    jurisdiction: str = "cc",
     headers: str = PISTE_API_HEADERS,
     base_url: str = PISTE_API_URL,
+    timeout: int = 60,
     mask: list[str] = DEFAULT_KEYS,
+    client: PisteClient = None,
 ):
-    response = requests.get(
-        url=f"{base_url}/decision", headers=headers, params={"id": document_id}
+    """Streams the decisions updated between two dates to a parquet file.
+
+    Each batch of the API is written as a row group, so memory use depends on
+    the batch size and not on the number of decisions of the window. The file
+    only appears once the export is complete. Returns the number of decisions.
+    `headers`, `base_url` and `timeout` are only used without `client`, as in
+    `iter_export_batches`.
+    """
+    n_results = 0
+
+    temporary_file = os.path.join(
+        os.path.dirname(filename), f".{os.path.basename(filename)}.tmp"
     )
 
-    if response.status_code == 200:
-        result = response.json()
+    try:
+        with pq.ParquetWriter(temporary_file, get_export_schema(mask)) as writer:
+            for batch in iter_export_batches(
+                start_date=start_date,
+                end_date=end_date,
+                jurisdiction=jurisdiction,
+                headers=headers,
+                base_url=base_url,
+                timeout=timeout,
+                mask=mask,
+                client=client,
+            ):
+                writer.write_table(batch)
+                n_results += batch.num_rows
+    except BaseException:
+        # the writer still closes the file, which would be a valid partial export
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+        raise
+
+    os.replace(temporary_file, filename)
+
+    return n_results
+
 
-        return {m: result.get(m) for m in mask}
+def download_specific_document_by_id(
+    document_id: str,
+    headers: str = PISTE_API_HEADERS,
+    base_url: str = PISTE_API_URL,
+    mask: list[str] = DEFAULT_KEYS,
+    client: PisteClient = None,
+):
+    if client is None:
+        with PisteClient(base_url=base_url, headers=headers) as client:
+            return download_specific_document_by_id(
+                document_id, mask=mask, client=client
+            )
 
-    logging.debug(f"Received status code {response.status_code}")
+    try:
+        result = client.get("decision", params={"id": document_id})
+    except requests.RequestException as e:
+        logging.debug(f"Could not download decision {document_id}: {e}")
+        return dict()
 
-    return dict()
+    return {m: result.get(m) for m in mask}
@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.types import CategoricalDtype
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# fastest engine of benchmarks/benchmark_engines.py, pandas staying the reference
+DEFAULT_ENGINE = "pyarrow"
+
+
+def aggregate_pandas(df: pd.DataFrame, keys: list[str], value: str = None):
+    """Sums `value` per group of `keys`, or counts the lines of each group if
+    `value` is None. This is the reference implementation of the engines.
+
+    Only observed groups without missing keys are returned, in an order left to
+    the engine, with the keys as columns. The keys keep their type, sums keep the
+    type of `value` and counts are int64.
+    """
+    # without sorting, pandas would reorder the categories of the keys
+    grouped = df.groupby(keys, observed=True)
+    if value is None:
+        return grouped.size().reset_index(name="size")
+    return grouped.agg({value: "sum"}).reset_index()
+
+
+def to_arrow_keys(df: pd.DataFrame, keys: list[str], value: str = None):
+    """Returns the keys and value of a DataFrame as an arrow table, categorical
+    keys being replaced by their codes and missing keys by nulls"""
+    columns = {}
+    for key in keys:
+        series = df[key]
+        if isinstance(series.dtype, CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            columns[key] = pa.array(codes, mask=codes == -1)
+        else:
+            columns[key] = pa.Array.from_pandas(series.to_numpy())
+    if value is not None:
+        columns[value] = pa.Array.from_pandas(df[value].to_numpy())
+    return pa.table(columns)
+
+
+def from_arrow_keys(
+    table: pa.Table, df: pd.DataFrame, keys: list[str], value: str = None
+):
+    """Returns an aggregated arrow table as the DataFrame `aggregate_pandas`
+    returns, restoring the categories and types of the keys"""
+    columns = {}
+    for key in keys:
+        dtype = df[key].dtype
+        values = table[key].to_numpy()
+        if isinstance(dtype, CategoricalDtype):
+            columns[key] = pd.Categorical.from_codes(values, dtype=dtype)
+        else:
+            columns[key] = pd.Series(values).astype(dtype)
+    if value is None:
+        columns["size"] = table["size"].to_numpy().astype(np.int64)
+    else:
+        columns[value] = table[value].to_numpy().astype(df[value].dtype)
+    return pd.DataFrame(columns)
+
+
+def aggregate_pyarrow(df: pd.DataFrame, keys: list[str], value: str = None):
+    """Same as `aggregate_pandas`, grouping with the multi-threaded hash
+    aggregation of pyarrow"""
+    table = to_arrow_keys(df, keys, value=value)
+
+    if value is None:
+        aggregation = (keys[0], "count", pc.CountOptions(mode="all"))
+        result_name = f"{keys[0]}_count"
+    else:
+        aggregation = (value, "sum")
+        result_name = f"{value}_sum"
+
+    table = table.group_by(keys).aggregate([aggregation])
+    table = table.rename_columns(
+        [
+            (value or "size") if name == result_name else name
+            for name in table.column_names
+        ]
+    )
+
+    is_valid = pc.is_valid(table[keys[0]])
+    for key in keys[1:]:
+        is_valid = pc.and_(is_valid, pc.is_valid(table[key]))
+    table = table.filter(is_valid)
+
+    return from_arrow_keys(table, df, keys, value=value)
+
+
+def aggregate_polars(df: pd.DataFrame, keys: list[str], value: str = None):
+    """Same as `aggregate_pandas`, grouping with polars"""
+    data = pl.from_arrow(to_arrow_keys(df, keys, value=value))
+
+    if value is None:
+        aggregation = pl.len().alias("size")
+    else:
+        aggregation = pl.col(value).sum()
+
+    table = data.group_by(keys).agg(aggregation).drop_nulls(keys).to_arrow()
+    return from_arrow_keys(table, df, keys, value=value)
+
+
+ENGINES = {
+    "pandas": aggregate_pandas,
+    "pyarrow": aggregate_pyarrow,
+}
+if pl is not None:
+    ENGINES["polars"] = aggregate_polars
+
+
+def get_engine(engine: str = None):
+    """Returns the aggregation function of an engine, by default the one of the
+    AGGREGATION_ENGINE environment variable"""
+    engine = engine or os.environ.get("AGGREGATION_ENGINE") or DEFAULT_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown or unavailable engine {engine}, expected one of {list(ENGINES)}"
+        )
+    return ENGINES[engine]
+
+
+def aggregate(df: pd.DataFrame, keys: list[str], value: str = None, engine=None):
+    return get_engine(engine)(df, keys, value=value)
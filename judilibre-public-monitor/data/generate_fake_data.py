@@ -1,137 +1,282 @@
-from uuid import uuid4
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
-from data_utils import CHAMBERS_CA
-from data_utils import CHAMBERS_CC
-from data_utils import DECISION_TYPES
-from data_utils import LETTERS
-from data_utils import LOCATIONS_CA
-from data_utils import LOCATIONS_CC
-from data_utils import NUMBERS
-
-
-def generate_nac_codes(sample_size: int = 1_000):
-    number1 = np.random.choice(NUMBERS, size=sample_size, replace=True)
-    number2 = np.random.choice(NUMBERS, size=sample_size, replace=True)
-    letter = np.random.choice(LETTERS[26:], size=sample_size, replace=True)
-
-    return pd.Series(number1) + pd.Series(number2) + pd.Series(letter)
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .data_utils import CHAMBERS_CA
+from .data_utils import LOCATIONS_CA
+from .data_utils import LOCATIONS_CC
+from .dataset import DECISIONS_SCHEMA
+
+NAC_REFERENCE_FILE = os.path.join(os.path.dirname(__file__), "nac_reference.csv")
+
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+DIGITS = np.frombuffer(b"0123456789", dtype=np.uint8)
+
+START_DATE = np.datetime64("1990-01-01")
+END_DATE = np.datetime64("2023-12-31")
+# mean number of days between the decision and its last update
+MEAN_UPDATE_DELAY = 180
+
+# courts of appeal by decreasing number of decisions, the others following in
+# the order of LOCATIONS_CA
+LARGEST_LOCATIONS_CA = [
+    "ca_paris",
+    "ca_aix_provence",
+    "ca_versailles",
+    "ca_lyon",
+    "ca_douai",
+    "ca_rennes",
+    "ca_bordeaux",
+    "ca_montpellier",
+    "ca_toulouse",
+    "ca_grenoble",
+]
+
+CHAMBERS_CC_WEIGHTS = {
+    "cr": 30,
+    "soc": 20,
+    "civ2": 15,
+    "civ1": 10,
+    "civ3": 10,
+    "comm": 10,
+    "ordo": 3,
+    "other": 1,
+    "mi": 0.2,
+    "pl": 0.2,
+    "creun": 0.1,
+}
+
+SOURCES_WEIGHTS = {
+    "ca": {"jurica": 0.8, "dila": 0.2},
+    "cc": {"jurinet": 0.8, "dila": 0.2},
+}
+
+DECISION_TYPES_WEIGHTS = {
+    "ca": {"arret": 85, "ordonnance": 12, "other": 2, "saisie": 1},
+    "cc": {"arret": 90, "ordonnance": 4, "qpc": 3, "avis": 1, "other": 2},
+}
+
+# share of decisions of courts of appeal without NAC code
+MISSING_NAC_SHARE = 0.02
+
+
+def get_zipf_weights(n_values: int, exponent: float = 1.0):
+    """Returns the probabilities of a Zipf law over `n_values` ranks"""
+    weights = 1 / np.arange(1, n_values + 1) ** exponent
+    return weights / weights.sum()
+
+
+def get_distribution(weights: dict):
+    """Returns the values and probabilities of a dictionary of weights"""
+    probabilities = np.array(list(weights.values()), dtype=float)
+    return {"values": list(weights), "p": probabilities / probabilities.sum()}
+
+
+def get_distributions(seed: int = 0):
+    """Returns the distributions of the columns of each jurisdiction.
+
+    Courts of appeal and NAC codes follow Zipf laws, NAC codes being ranked in
+    an order drawn from `seed`, so that a few codes hold most decisions.
+    """
+    locations = LARGEST_LOCATIONS_CA + [
+        location for location in LOCATIONS_CA if location not in LARGEST_LOCATIONS_CA
+    ]
+    nac_codes = pd.read_csv(NAC_REFERENCE_FILE)["Code NAC"].tolist()
+    nac_codes = list(np.random.default_rng(seed).permutation(nac_codes))
+
+    return {
+        "ca": {
+            "source": get_distribution(SOURCES_WEIGHTS["ca"]),
+            "location": {"values": locations, "p": get_zipf_weights(len(locations))},
+            "chamber": get_distribution({chamber: 1 for chamber in CHAMBERS_CA}),
+            "type": get_distribution(DECISION_TYPES_WEIGHTS["ca"]),
+            "nac": {"values": nac_codes, "p": get_zipf_weights(len(nac_codes), 1.1)},
+        },
+        "cc": {
+            "source": get_distribution(SOURCES_WEIGHTS["cc"]),
+            "location": get_distribution({location: 1 for location in LOCATIONS_CC}),
+            "chamber": get_distribution(CHAMBERS_CC_WEIGHTS),
+            "type": get_distribution(DECISION_TYPES_WEIGHTS["cc"]),
+        },
+    }
+
+
+def choose(rng: np.random.Generator, distribution: dict, size: int, mask=None):
+    """Draws values from a distribution as a string array, built from
+    dictionary indices rather than Python strings"""
+    indices = rng.choice(len(distribution["values"]), p=distribution["p"], size=size)
+    indices = pa.array(indices.astype(np.int32), mask=mask)
+    return pa.DictionaryArray.from_arrays(
+        indices, pa.array(distribution["values"], type=pa.string())
+    ).cast(pa.string())
+
+
+def to_strings(characters: np.ndarray):
+    """Returns the lines of a 2D array of ASCII codes as a string array"""
+    characters = np.ascontiguousarray(characters, dtype=np.uint8)
+    strings = characters.view(f"S{characters.shape[1]}").ravel()
+    return pa.array(strings, type=pa.binary()).cast(pa.string())
+
+
+def generate_ids(rng: np.random.Generator, size: int):
+    """Returns random identifiers of 24 hexadecimal digits, as in Judilibre"""
+    random_bytes = np.frombuffer(rng.bytes(12 * size), dtype=np.uint8)
+    random_bytes = random_bytes.reshape(size, 12)
+    return to_strings(
+        HEX_DIGITS[np.stack([random_bytes >> 4, random_bytes & 15], axis=-1)].reshape(
+            size, 24
+        )
+    )
 
 
-def generate_dates(sample_size: int = 1_000):
-    days = np.random.randint(low=1, high=29, size=sample_size)
-    months = np.random.randint(low=1, high=13, size=sample_size)
-    years = 1970 + np.random.randint(low=0, high=50, size=sample_size)
-    return pd.to_datetime({"year": years, "month": months, "day": days})
+def generate_numbers(
+    rng: np.random.Generator, size: int, years: np.ndarray, separator: bytes
+):
+    """Returns case numbers such as 19/01234, from the year of the decision"""
+    digits = DIGITS[rng.integers(0, 10, size=(size, 5))]
+    year_digits = DIGITS[np.stack([(years // 10) % 10, years % 10], axis=-1)]
+    separators = np.full((size, 1), ord(separator), dtype=np.uint8)
+    return to_strings(np.concatenate([year_digits, separators, digits], axis=1))
 
 
-def generate_decision_types(sample_size: int = 1000):
-    decision_types = np.random.choice(
-        list(DECISION_TYPES.keys()), size=sample_size, replace=True
-    )
-    return pd.Series(decision_types)
+def generate_dates(rng: np.random.Generator, size: int):
+    """Returns decision and update dates, decisions getting more frequent over
+    time and being updated after they are rendered"""
+    n_days = (END_DATE - START_DATE).astype(int)
+    days = rng.triangular(0, n_days, n_days, size=size).astype(int)
+    decision_dates = START_DATE + days
+    delays = rng.exponential(MEAN_UPDATE_DELAY, size=size).astype(int)
+    return decision_dates, decision_dates + delays
 
 
-def generate_ca_data(sample_size: int = 10_000):
-    ids = [str(uuid4()) for _ in range(sample_size)]
-    numbers = [str(uuid4()) for _ in range(sample_size)]
-    sources = np.random.choice(
-        ["dila", "jurica"], p=[0.2, 0.8], replace=True, size=sample_size
-    )
-    nacs = generate_nac_codes(sample_size=sample_size)
-    decision_dates = generate_dates(sample_size=sample_size)
-    update_dates = generate_dates(sample_size=sample_size)
-    locations = np.random.choice(
-        list(LOCATIONS_CA.keys()), replace=True, size=sample_size
-    )
-    chambers = np.random.choice(
-        list(CHAMBERS_CA.keys()), replace=True, size=sample_size
-    )
-    types = generate_decision_types(sample_size=sample_size)
-
-    df = pd.DataFrame(
-        {
-            "id": ids,
-            "source": sources,
-            "nac": nacs,
-            "decision_date": decision_dates,
-            "update_date": update_dates,
-            "locations": locations,
-            "chambers": chambers,
-            "types": types,
-            "jurisdiction": "ca",
-            "number": numbers,
-        }
+def generate_chunk(
+    jurisdiction: str, size: int, distributions: dict, seed: np.random.SeedSequence
+):
+    """Returns `size` fake decisions of a jurisdiction, drawn from their own seed
+    so that every chunk can be generated independently"""
+    rng = np.random.default_rng(seed)
+    distributions = distributions[jurisdiction]
+
+    decision_dates, update_dates = generate_dates(rng, size)
+    years = decision_dates.astype("datetime64[Y]").astype(int) + 1970
+
+    if "nac" in distributions:
+        nacs = choose(
+            rng,
+            distributions["nac"],
+            size,
+            mask=rng.random(size) < MISSING_NAC_SHARE,
+        )
+    else:
+        nacs = pa.nulls(size, type=pa.string())
+
+    columns = {
+        "id": generate_ids(rng, size),
+        "source": choose(rng, distributions["source"], size),
+        "jurisdiction": pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(size, dtype=np.int32)), pa.array([jurisdiction])
+        ).cast(pa.string()),
+        "chamber": choose(rng, distributions["chamber"], size),
+        "number": generate_numbers(
+            rng, size, years, separator=b"/" if jurisdiction == "ca" else b"-"
+        ),
+        "location": choose(rng, distributions["location"], size),
+        "decision_date": pa.array(decision_dates).cast(pa.string()),
+        "update_date": pa.array(update_dates).cast(pa.string()),
+        "type": choose(rng, distributions["type"], size),
+        "nac": nacs,
+    }
+    return pa.table(
+        [columns[name] for name in DECISIONS_SCHEMA.names], DECISIONS_SCHEMA
     )
 
-    dates_min, dates_max = df[["decision_date", "update_date"]].min(axis=1), df[
-        ["decision_date", "update_date"]
-    ].max(axis=1)
-    df["update_date"] = dates_max
-    df["decision_date"] = dates_min
 
-    return df
-
-
-def generate_cc_data(sample_size: int = 10_000):
-    ids = [str(uuid4()) for _ in range(sample_size)]
-    numbers = [str(uuid4()) for _ in range(sample_size)]
-    sources = np.random.choice(
-        ["dila", "jurinet"], p=[0.2, 0.8], replace=True, size=sample_size
-    )
-    nacs = None
-    decision_dates = generate_dates(sample_size=sample_size)
-    update_dates = generate_dates(sample_size=sample_size)
-    locations = np.random.choice(
-        list(LOCATIONS_CC.keys()), replace=True, size=sample_size
-    )
-    chambers = np.random.choice(
-        list(CHAMBERS_CC.keys()), replace=True, size=sample_size
-    )
-    types = generate_decision_types(sample_size=sample_size)
-
-    df = pd.DataFrame(
-        {
-            "id": ids,
-            "source": sources,
-            "nac": nacs,
-            "decision_date": decision_dates,
-            "update_date": update_dates,
-            "locations": locations,
-            "chambers": chambers,
-            "types": types,
-            "jurisdiction": "cc",
-            "number": numbers,
-        }
-    )
+def get_chunks(
+    ca_sample_size: int, cc_sample_size: int, chunk_size: int, seed: int = 0
+):
+    """Returns the jurisdiction, size and seed of each chunk"""
+    chunks = []
+    for jurisdiction, sample_size in [("ca", ca_sample_size), ("cc", cc_sample_size)]:
+        chunks += [
+            (jurisdiction, min(chunk_size, sample_size - start))
+            for start in range(0, sample_size, chunk_size)
+        ]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    return [(*chunk, chunk_seed) for chunk, chunk_seed in zip(chunks, seeds)]
 
-    dates_min, dates_max = df[["decision_date", "update_date"]].min(axis=1), df[
-        ["decision_date", "update_date"]
-    ].max(axis=1)
-    df["update_date"] = dates_max
-    df["decision_date"] = dates_min
 
-    return df
+def generate_tables(
+    ca_sample_size: int = 10_000,
+    cc_sample_size: int = 10_000,
+    chunk_size: int = 1_000_000,
+    seed: int = 0,
+    n_workers: int = 1,
+):
+    """Yields the chunks of fake decisions in order, generated by `n_workers`
+    processes at most `2 * n_workers` chunks ahead of the consumer"""
+    distributions = get_distributions(seed=seed)
+    chunks = get_chunks(ca_sample_size, cc_sample_size, chunk_size, seed=seed)
+
+    if n_workers <= 1:
+        for jurisdiction, size, chunk_seed in chunks:
+            yield generate_chunk(jurisdiction, size, distributions, chunk_seed)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = deque()
+        for jurisdiction, size, chunk_seed in chunks:
+            futures.append(
+                executor.submit(
+                    generate_chunk, jurisdiction, size, distributions, chunk_seed
+                )
+            )
+            if len(futures) >= 2 * n_workers:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
 
 
 def generate_data(
     ca_sample_size: int = 10_000,
-    cc_sample_size: int = 10_0000,
+    cc_sample_size: int = 10_000,
     filename: str = "data/full_data_fake.parquet",
+    chunk_size: int = 1_000_000,
+    seed: int = 0,
+    n_workers: int = 1,
 ):
-    df = pd.concat(
-        [
-            generate_ca_data(sample_size=ca_sample_size),
-            generate_cc_data(sample_size=cc_sample_size),
-        ]
-    )
+    """Writes fake decisions to a parquet file, one row group per chunk.
 
-    df.to_parquet(filename, index=False)
+    The same sizes, chunk size and seed always give the same decisions, whatever
+    the number of workers.
+    """
+    temporary_file = os.path.join(
+        os.path.dirname(filename), f".{os.path.basename(filename)}.tmp"
+    )
+    n_decisions = 0
+    with pq.ParquetWriter(temporary_file, DECISIONS_SCHEMA) as writer:
+        for table in generate_tables(
+            ca_sample_size=ca_sample_size,
+            cc_sample_size=cc_sample_size,
+            chunk_size=chunk_size,
+            seed=seed,
+            n_workers=n_workers,
+        ):
+            writer.write_table(table)
+            n_decisions += table.num_rows
+            logging.debug(f"{n_decisions} decisions written")
+    os.replace(temporary_file, filename)
 
 
 if __name__ == "__main__":
-    import logging
     from argparse import ArgumentParser
 
     argument_parser = ArgumentParser()
@@ -144,10 +289,36 @@ if __name__ == "__main__":
     )
 
     argument_parser.add_argument(
-        "-s",
-        "--sample-size",
-        help="Number of rows in the fake data",
+        "--ca-sample-size",
+        help="Number of decisions of courts of appeal, such as 1e6",
+        default=10_000,
+        type=lambda size: int(float(size)),
+    )
+
+    argument_parser.add_argument(
+        "--cc-sample-size",
+        help="Number of decisions of the Cour de cassation",
         default=10_000,
+        type=lambda size: int(float(size)),
+    )
+
+    argument_parser.add_argument(
+        "-c",
+        "--chunk-size",
+        help="Number of decisions per row group",
+        default=1_000_000,
+        type=lambda size: int(float(size)),
+    )
+
+    argument_parser.add_argument(
+        "--seed", help="Seed of the random generator", default=0, type=int
+    )
+
+    argument_parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of processes generating the chunks",
+        default=1,
         type=int,
     )
 
@@ -159,25 +330,27 @@ if __name__ == "__main__":
 
     arguments = argument_parser.parse_args()
 
-    verbose = arguments.verbose
-    sample_size = arguments.sample_size
     file_name = arguments.file_name
 
-    if verbose:
+    if arguments.verbose:
         logging.basicConfig(level=logging.DEBUG)
 
     logging.debug(
-        f"Creating a file with {sample_size} rows and saving it at `{file_name}`"
+        f"Creating a file with {arguments.ca_sample_size} decisions of courts of "
+        f"appeal and {arguments.cc_sample_size} decisions of the Cour de cassation "
+        f"and saving it at `{file_name}`"
     )
 
     generate_data(
-        ca_sample_size=sample_size, cc_sample_size=sample_size, filename=file_name
+        ca_sample_size=arguments.ca_sample_size,
+        cc_sample_size=arguments.cc_sample_size,
+        filename=file_name,
+        chunk_size=arguments.chunk_size,
+        seed=arguments.seed,
+        n_workers=arguments.workers,
     )
 
     logging.debug("Done!")
 
-    logging.debug(f"Reading data from `{file_name}`")
-
-    df = pd.read_parquet(file_name)
-
-    logging.debug(df.head())
+    # only the first row group, the corpus may not fit in memory
+    logging.debug(pq.ParquetFile(file_name).read_row_group(0).to_pandas().head())
@@ -0,0 +1,278 @@
+import datetime
+import json
+import logging
+import os
+import uuid
+
+import numpy as np
+
+# the index of the decision ids is stored next to the data, in this folder
+ID_INDEX_DIRNAME = "id_index"
+MANIFEST_FILENAME = "index.json"
+
+# version of the files of the index, which is built again if it changes
+INDEX_VERSION = 2
+
+# segments are merged once there are more of them
+MAX_SEGMENTS = 8
+
+
+def to_bytes_array(values):
+    """Returns ascii strings as a numpy array of fixed size bytes, ordered as
+    the strings"""
+    values = np.asarray(values)
+    if values.dtype.kind == "S":
+        return values
+    return values.astype("S")
+
+
+def keep_last(ids: np.ndarray, update_dates: np.ndarray, order: np.ndarray):
+    """Returns the ids sorted with `order` and their dates, keeping the last
+    entry of each id"""
+    ids, update_dates = ids[order], update_dates[order]
+    is_last = np.append(ids[1:] != ids[:-1], True)
+    return ids[is_last], update_dates[is_last]
+
+
+def keep_latest(ids: np.ndarray, update_dates: np.ndarray):
+    """Returns the sorted ids and their latest update date"""
+    return keep_last(ids, update_dates, np.lexsort((update_dates, ids)))
+
+
+def write_array(array: np.ndarray, filename: str):
+    temporary_file = os.path.join(
+        os.path.dirname(filename), f".{os.path.basename(filename)}.tmp"
+    )
+    with open(temporary_file, "wb") as f:
+        np.save(f, array)
+    os.replace(temporary_file, filename)
+
+
+class IdIndex:
+    """Sorted index of the ids of the decisions of the dataset and of the
+    update date of their latest version.
+
+    The index is stored in immutable segments, each a sorted numpy array of ids
+    and the array of their update dates, as fixed size bytes, memory mapped when
+    read. Upserting ids writes a new segment, whose dates supersede the ones of
+    the former segments, and the segments are merged once there are more than
+    `max_segments`.
+
+    The manifest lists the segments of the index and is replaced atomically
+    after they are written: readers either see the former or the new segments,
+    and the files of an interrupted update are ignored.
+    """
+
+    def __init__(self, index_path: str, max_segments: int = MAX_SEGMENTS):
+        self.index_path = index_path
+        self.max_segments = max_segments
+
+    @property
+    def manifest_file(self):
+        return os.path.join(self.index_path, MANIFEST_FILENAME)
+
+    def exists(self):
+        return os.path.exists(self.manifest_file)
+
+    def read_manifest(self):
+        with open(self.manifest_file) as f:
+            return json.load(f)
+
+    def write_manifest(self, segments: list[str], n_ids: int, source=None):
+        temporary_file = os.path.join(self.index_path, f".{MANIFEST_FILENAME}.tmp")
+        with open(temporary_file, "w") as f:
+            json.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "segments": segments,
+                    "n_ids": n_ids,
+                    "source": source,
+                },
+                f,
+            )
+        os.replace(temporary_file, self.manifest_file)
+
+    def is_up_to_date(self, source=None):
+        if not self.exists():
+            return False
+        manifest = self.read_manifest()
+        return manifest.get("version") == INDEX_VERSION and manifest["source"] == source
+
+    def get_segment_files(self, segment: str):
+        return [
+            os.path.join(self.index_path, f"{segment}.ids.npy"),
+            os.path.join(self.index_path, f"{segment}.update_dates.npy"),
+        ]
+
+    def get_segments(self):
+        """Returns the ids and update dates of the segments, from the oldest.
+
+        Segments removed by a merge while they are listed are read again from
+        the new manifest. Once mapped, a segment stays readable if removed.
+        """
+        while True:
+            segments = self.read_manifest()["segments"]
+            try:
+                return [
+                    tuple(
+                        np.load(f, mmap_mode="r")
+                        for f in self.get_segment_files(segment)
+                    )
+                    for segment in segments
+                ]
+            except FileNotFoundError:
+                if self.read_manifest()["segments"] == segments:
+                    raise
+
+    def count(self):
+        return self.read_manifest()["n_ids"]
+
+    def lookup(self, ids):
+        """Returns whether each id is in the index and the update date of its
+        latest version, empty for unknown ids"""
+        ids = to_bytes_array(ids)
+        is_known = np.zeros(len(ids), dtype=bool)
+        update_dates = np.zeros(len(ids), dtype="S1")
+        for segment_ids, segment_dates in self.get_segments():
+            if len(segment_ids) == 0:
+                continue
+            positions = np.searchsorted(segment_ids, ids).clip(max=len(segment_ids) - 1)
+            is_found = segment_ids[positions] == ids
+            is_known |= is_found
+            update_dates = update_dates.astype(
+                np.promote_types(update_dates.dtype, segment_dates.dtype)
+            )
+            update_dates[is_found] = segment_dates[positions[is_found]]
+        return is_known, update_dates
+
+    def contains(self, ids):
+        """Returns whether each id is in the index, as a boolean array"""
+        return self.lookup(ids)[0]
+
+    def iter_merged_ids(self, chunk_size: int = 100_000):
+        """Yields the sorted ids of all the segments by chunks, as bytes.
+
+        The sorted segments are merged chunk by chunk: each chunk holds the ids
+        up to the smallest last id of the next `chunk_size` ids of each
+        segment, so that no id after it is missing. A chunk has at most
+        `chunk_size` ids per segment.
+        """
+        segments = [ids for ids, _ in self.get_segments() if len(ids)]
+        if len(segments) == 1:
+            ids = segments[0]
+            for start in range(0, len(ids), chunk_size):
+                yield np.asarray(ids[start : start + chunk_size])
+            return
+
+        positions = [0] * len(segments)
+        while True:
+            remaining = [i for i, ids in enumerate(segments) if positions[i] < len(ids)]
+            if not remaining:
+                return
+            last_id = min(
+                segments[i][min(positions[i] + chunk_size, len(segments[i])) - 1]
+                for i in remaining
+            )
+            chunk = []
+            for i in remaining:
+                end = np.searchsorted(segments[i], last_id, side="right")
+                chunk.append(segments[i][positions[i] : end])
+                positions[i] = end
+            yield np.unique(np.concatenate(chunk))
+
+    def get_ids(self):
+        """Returns all the ids, sorted"""
+        chunks = list(self.iter_merged_ids())
+        return np.concatenate(chunks) if chunks else to_bytes_array([])
+
+    def iter_ids(self, chunk_size: int = 100_000):
+        """Yields the sorted ids by chunks, as strings, at least one chunk being
+        yielded. Reading the index never reads the rest of the decisions, nor
+        all of its own segments at once."""
+        is_empty = True
+        for ids in self.iter_merged_ids(chunk_size=chunk_size):
+            is_empty = False
+            yield ids.astype(str)
+        if is_empty:
+            yield np.array([], dtype=str)
+
+    def write_segment(self, ids: np.ndarray, update_dates: np.ndarray, suffix=""):
+        segment = (
+            f"segment-{datetime.datetime.now():%Y%m%d%H%M%S%f}-"
+            f"{uuid.uuid4().hex[:8]}{suffix}"
+        )
+        for array, f in zip([ids, update_dates], self.get_segment_files(segment)):
+            write_array(array, f)
+        return segment
+
+    def build(self, batches, source=None):
+        """Replaces the index by the ids and update dates of an iterable of
+        pairs of arrays, keeping the latest update date of each id"""
+        os.makedirs(self.index_path, exist_ok=True)
+        former_segments = self.read_manifest()["segments"] if self.exists() else []
+
+        ids, update_dates = [], []
+        for batch_ids, batch_dates in batches:
+            ids.append(to_bytes_array(batch_ids))
+            update_dates.append(to_bytes_array(batch_dates))
+        if ids:
+            ids, update_dates = keep_latest(
+                np.concatenate(ids), np.concatenate(update_dates)
+            )
+        else:
+            ids, update_dates = to_bytes_array([]), to_bytes_array([])
+
+        self.write_manifest(
+            [self.write_segment(ids, update_dates)], len(ids), source=source
+        )
+        self.remove_segments(former_segments)
+
+        logging.info(f"Indexed {len(ids)} ids in {self.index_path}")
+
+    def upsert(self, ids, update_dates):
+        """Sets the update date of the latest version of ids, adding the ones
+        that are not in the index yet. Returns the number of added ids."""
+        ids, update_dates = keep_latest(
+            to_bytes_array(ids), to_bytes_array(update_dates)
+        )
+        if len(ids) == 0:
+            return 0
+
+        n_added = int((~self.contains(ids)).sum())
+        manifest = self.read_manifest()
+        segment = self.write_segment(ids, update_dates)
+        self.write_manifest(
+            manifest["segments"] + [segment],
+            manifest["n_ids"] + n_added,
+            source=manifest["source"],
+        )
+        self.compact()
+
+        return n_added
+
+    def compact(self):
+        """Merges the segments into a single one if there are too many of them"""
+        manifest = self.read_manifest()
+        segments = manifest["segments"]
+        if len(segments) <= self.max_segments:
+            return
+
+        arrays = self.get_segments()
+        ids = np.concatenate([ids for ids, _ in arrays])
+        update_dates = np.concatenate([dates for _, dates in arrays])
+        # the newest segments supersede the former ones
+        ids, update_dates = keep_last(ids, update_dates, np.argsort(ids, kind="stable"))
+
+        merged = self.write_segment(ids, update_dates, "-c")
+        self.write_manifest([merged], len(ids), source=manifest["source"])
+        self.remove_segments(segments)
+
+        logging.info(f"Merged {len(segments)} segments of {self.index_path}")
+
+    def remove_segments(self, segments: list[str]):
+        for segment in segments:
+            for f in self.get_segment_files(segment):
+                try:
+                    os.remove(f)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,228 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+import pyarrow as pa
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+# changes since the manifest was last written, one JSON line each
+JOURNAL_FILENAME = "ingest_manifest.journal"
+MANIFEST_VERSION = 1
+
+# the API keeps indexing decisions updated on a day for a while after it, so a
+# window is only considered complete if fetched this many days after its end
+WINDOW_SETTLE_DAYS = 2
+
+# days before the latest update date downloaded again, decisions being indexed
+# by the API some time after their update date. Older windows are never
+# downloaded again, so the manifest forgets them once ingested.
+LOOKBACK_DAYS = 2
+
+# window states, in order
+FETCHING = "fetching"
+FETCHED = "fetched"
+INGESTED = "ingested"
+
+
+def get_window_key(jurisdiction: str, start_date, end_date):
+    return f"{jurisdiction}/{start_date}/{end_date}"
+
+
+def hash_batch(batch: pa.Table):
+    """Returns the hash of the ids and update dates of a batch of decisions"""
+    digest = hashlib.sha256()
+    for decision_id, update_date in zip(
+        batch["id"].to_pylist(), batch["update_date"].to_pylist()
+    ):
+        digest.update(f"{decision_id}\t{update_date}\n".encode())
+    return digest.hexdigest()
+
+
+def hash_window(batch_hashes: list[str]):
+    return hashlib.sha256("".join(batch_hashes).encode()).hexdigest()
+
+
+class IngestManifest:
+    """Progress of the downloads of the latest decisions.
+
+    The manifest records, per jurisdiction, the latest update date of the
+    decisions written to the dataset, and for each window of update dates its
+    state, the number of batches and decisions fetched and their hashes.
+
+    Each change is appended to a journal, so that recording a batch does not
+    depend on the size of the manifest and an interrupted download resumes from
+    the last fetched batch. `save` writes the manifest atomically then empties
+    the journal, after removing the ingested windows older than the lookback
+    period, so that the manifest does not grow with the history. Windows may be
+    updated from several threads.
+    """
+
+    def __init__(self, path: str = "."):
+        self.manifest_file = os.path.join(path, MANIFEST_FILENAME)
+        self.journal_file = os.path.join(path, JOURNAL_FILENAME)
+        self._lock = threading.Lock()
+
+        self.watermarks = {}
+        self.windows = {}
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.watermarks = manifest["watermarks"]
+                self.windows = manifest["windows"]
+        self.replay_journal()
+
+    def replay_journal(self):
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file) as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of an interrupted write
+                    break
+                if "watermark" in change:
+                    self.watermarks[change["watermark"]] = change["update_date"]
+                else:
+                    self.windows[change["key"]] = change["window"]
+
+    def record(self, change: dict):
+        """Appends a change to the journal. The lock must be held."""
+        with open(self.journal_file, "a") as f:
+            f.write(json.dumps(change) + "\n")
+
+    def record_window(self, key: str):
+        self.record({"key": key, "window": self.windows[key]})
+
+    def prune(self):
+        """Removes the ingested windows starting before the lookback period of
+        their jurisdiction, which are never downloaded again. The lock must be
+        held."""
+        for key, window in list(self.windows.items()):
+            watermark = self.watermarks.get(window["jurisdiction"])
+            if (
+                window["state"] == INGESTED
+                and watermark is not None
+                and datetime.date.fromisoformat(window["start_date"])
+                < datetime.date.fromisoformat(watermark)
+                - datetime.timedelta(days=LOOKBACK_DAYS)
+            ):
+                del self.windows[key]
+
+    def save(self):
+        """Replaces the manifest file atomically, without the windows never
+        downloaded again, then empties the journal"""
+        with self._lock:
+            self.prune()
+            temporary_file = os.path.join(
+                os.path.dirname(self.manifest_file), f".{MANIFEST_FILENAME}.tmp"
+            )
+            with open(temporary_file, "w") as f:
+                json.dump(
+                    {
+                        "version": MANIFEST_VERSION,
+                        "watermarks": self.watermarks,
+                        "windows": self.windows,
+                    },
+                    f,
+                    indent=1,
+                )
+            os.replace(temporary_file, self.manifest_file)
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+
+    def get_watermark(self, jurisdiction: str):
+        """Returns the latest update date of the decisions of a jurisdiction
+        written to the dataset, or None if unknown"""
+        watermark = self.watermarks.get(jurisdiction)
+        return None if watermark is None else datetime.date.fromisoformat(watermark)
+
+    def set_watermark(self, jurisdiction: str, update_date: datetime.date):
+        with self._lock:
+            watermark = self.get_watermark(jurisdiction)
+            if watermark is None or update_date > watermark:
+                self.watermarks[jurisdiction] = str(update_date)
+                self.record(
+                    {"watermark": jurisdiction, "update_date": str(update_date)}
+                )
+
+    def get_window(self, jurisdiction: str, start_date, end_date):
+        key = get_window_key(jurisdiction, start_date, end_date)
+        with self._lock:
+            window = self.windows.get(key)
+            return None if window is None else dict(window)
+
+    def is_complete(self, jurisdiction: str, start_date, end_date):
+        """Returns whether a window was ingested after it settled, so that it
+        does not need to be downloaded again"""
+        window = self.get_window(jurisdiction, start_date, end_date)
+        return window is not None and window["state"] == INGESTED and window["settled"]
+
+    def start_window(self, jurisdiction: str, start_date, end_date):
+        """Returns the number of batches already fetched of a window, starting
+        it again from its first batch if it was already fetched"""
+        key = get_window_key(jurisdiction, start_date, end_date)
+        with self._lock:
+            window = self.windows.get(key)
+            if window is not None and window["state"] == FETCHING:
+                return window["n_batches"]
+            self.windows[key] = {
+                "jurisdiction": jurisdiction,
+                "start_date": str(start_date),
+                "end_date": str(end_date),
+                "state": FETCHING,
+                "settled": False,
+                "fetched_at": None,
+                "n_batches": 0,
+                "n_rows": 0,
+                "batch_hashes": [],
+                "hash": None,
+            }
+            self.record_window(key)
+            return 0
+
+    def add_batch(self, jurisdiction: str, start_date, end_date, batch: pa.Table):
+        """Records a batch of a window, once written"""
+        key = get_window_key(jurisdiction, start_date, end_date)
+        with self._lock:
+            window = self.windows[key]
+            window["n_batches"] += 1
+            window["n_rows"] += batch.num_rows
+            window["batch_hashes"].append(hash_batch(batch))
+            self.record_window(key)
+
+    def finish_window(self, jurisdiction: str, start_date, end_date):
+        key = get_window_key(jurisdiction, start_date, end_date)
+        today = datetime.date.today()
+        with self._lock:
+            window = self.windows[key]
+            window["state"] = FETCHED
+            window["fetched_at"] = str(today)
+            window["settled"] = (
+                datetime.date.fromisoformat(window["end_date"])
+                + datetime.timedelta(days=WINDOW_SETTLE_DAYS)
+                <= today
+            )
+            window["hash"] = hash_window(window["batch_hashes"])
+            self.record_window(key)
+
+    def get_fetched_windows(self):
+        """Returns the windows fetched but not ingested yet"""
+        with self._lock:
+            return [
+                dict(window)
+                for window in self.windows.values()
+                if window["state"] == FETCHED
+            ]
+
+    def set_ingested(self, windows: list[dict]):
+        with self._lock:
+            for window in windows:
+                key = get_window_key(
+                    window["jurisdiction"], window["start_date"], window["end_date"]
+                )
+                self.windows[key]["state"] = INGESTED
+                self.record_window(key)
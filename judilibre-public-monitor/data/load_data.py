@@ -1,108 +1,318 @@
 import os
+import time
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import CategoricalDtype
 
 from .data_utils import CLEAN_COLUMN_NAMES
+from .data_utils import CLEAN_JURISDICTIONS_DTYPE
+from .data_utils import CLEAN_LOCATIONS_DTYPE
+from .data_utils import CLEAN_SOURCES_DTYPE
+from .data_utils import CLEAN_TYPES_DTYPE
+from .data_utils import COURT_CC
+from .data_utils import COURTS_DTYPE
 from .data_utils import FORMATIONS_CC
+from .data_utils import FORMATIONS_DTYPE
 from .data_utils import JURISDICTIONS
 from .data_utils import LOCATIONS
 from .data_utils import remove_cour_dappel
 from .data_utils import SOURCES
 from .data_utils import TYPES
+from .data_utils import UNKNOWN
+from .dataset import get_decisions_filter
+from .dataset import open_id_index
+from .dataset import read_decisions
+from .engines import aggregate
 
 
-def load_data(
+CUBE_DIMENSIONS = [
+    "source",
+    "jurisdiction",
+    "court",
+    "location",
+    "nac",
+    "formation_clean",
+    "type",
+    "decision_date",
+]
+# the cube is sorted by decision date first so that date ranges can be sliced
+CUBE_SORT_ORDER = ["decision_date", *CUBE_DIMENSIONS[:-1]]
+
+# columns of the decisions used by the cube, the others are not read
+DECISION_COLUMNS = [
+    "source",
+    "jurisdiction",
+    "location",
+    "chamber",
+    "type",
+    "nac",
+    "decision_date",
+]
+
+NAC_LABEL_COLUMNS = ["Code NAC", "N2", "Niveau 1", "Niveau 2", "Intitulé NAC"]
+
+
+def map_categories(
+    series: pd.Series,
+    mapping: dict,
+    default: str = None,
+    dtype: CategoricalDtype = None,
+):
+    """Maps the categories of a series instead of its rows.
+
+    Values missing from `mapping` (and missing values) are replaced by
+    `default`. The result is a categorical series of type `dtype`, or of the
+    sorted mapped values if no `dtype` is given.
+    """
+    values = series.astype("category").cat
+
+    mapped = [mapping.get(category, default) for category in values.categories]
+    if dtype is None:
+        dtype = CategoricalDtype(sorted({m for m in mapped if m is not None}))
+
+    new_codes = dtype.categories.get_indexer(pd.Index(mapped, dtype=object))
+    # code -1 is used for missing values: appending the default code maps them
+    new_codes = np.append(new_codes, dtype.categories.get_indexer([default]))
+
+    codes = new_codes[values.codes.to_numpy()]
+
+    return pd.Series(
+        pd.Categorical.from_codes(codes, dtype=dtype),
+        index=series.index,
+        name=series.name,
+    )
+
+
+def parse_dates(series: pd.Series):
+    """Parses the dates of a series once per distinct value"""
+    codes, uniques = pd.factorize(series)
+    dates = pd.DatetimeIndex(pd.to_datetime(uniques))
+    return pd.Series(
+        dates.take(codes, allow_fill=True, fill_value=pd.NaT),
+        index=series.index,
+        name=series.name,
+    )
+
+
+def read_data(
     path: str = ".",
     main_filename: str = "full_data.parquet",
     nac_reference_filename: str = "nac_reference.csv",
+    jurisdictions: list[str] = None,
+    start_date=None,
+    end_date=None,
 ):
-    df = pd.read_parquet(os.path.join(path, main_filename))
+    """Reads the decisions of some jurisdictions rendered between two dates, and
+    the NAC codes reference"""
+    df = read_decisions(
+        path=path,
+        columns=DECISION_COLUMNS,
+        main_filename=main_filename,
+        filter=get_decisions_filter(
+            jurisdictions=jurisdictions, start_date=start_date, end_date=end_date
+        ),
+    )
 
     df_nac = pd.read_csv(os.path.join(path, nac_reference_filename))
 
-    # cleaning data
-    df.loc[df["jurisdiction"] == "cc", "location"] = "Cour de cassation"
+    return df, df_nac
+
 
-    df["court"] = "Cour de casation"
-    df.loc[df["jurisdiction"] == "ca", "court"] = df.loc[
-        df["jurisdiction"] == "ca", "location"
-    ].apply(lambda location: LOCATIONS.get(location, "Non renseigné"))
+def clean_data(df: pd.DataFrame):
+    jurisdiction = df["jurisdiction"].astype("category")
+    is_ca = (jurisdiction == "ca").to_numpy()
+    is_cc = (jurisdiction == "cc").to_numpy()
 
-    df["location"] = df["court"].apply(remove_cour_dappel)
+    court = map_categories(
+        df["location"], LOCATIONS, default=UNKNOWN, dtype=COURTS_DTYPE
+    ).where(is_ca, COURT_CC)
 
-    df["formation_clean"] = "Non renseigné"
+    location = map_categories(
+        court,
+        {c: remove_cour_dappel(c) for c in COURTS_DTYPE.categories},
+        dtype=CLEAN_LOCATIONS_DTYPE,
+    )
 
-    df.loc[df["jurisdiction"] == "cc", "formation_clean"] = df.loc[
-        df["jurisdiction"] == "cc", "chamber"
-    ].apply(FORMATIONS_CC.get)
+    formation_clean = map_categories(
+        df["chamber"], FORMATIONS_CC, dtype=FORMATIONS_DTYPE
+    ).where(is_cc, UNKNOWN)
 
-    df["jurisdiction"] = df["jurisdiction"].apply(
-        lambda jurisidction: JURISDICTIONS.get(jurisidction, "Non renseigné")
+    nac = df["nac"].astype("category")
+    if UNKNOWN not in nac.cat.categories:
+        nac = nac.cat.add_categories(UNKNOWN)
+    nac = nac.fillna(UNKNOWN)
+    nac = nac.cat.reorder_categories(sorted(nac.cat.categories))
+
+    return pd.DataFrame(
+        {
+            "source": map_categories(
+                df["source"], SOURCES, default="Autre", dtype=CLEAN_SOURCES_DTYPE
+            ),
+            "jurisdiction": map_categories(
+                jurisdiction,
+                JURISDICTIONS,
+                default=UNKNOWN,
+                dtype=CLEAN_JURISDICTIONS_DTYPE,
+            ),
+            "court": court,
+            "location": location,
+            "nac": nac,
+            "formation_clean": formation_clean,
+            "type": map_categories(
+                df["type"], TYPES, default="Autre", dtype=CLEAN_TYPES_DTYPE
+            ),
+            "decision_date": parse_dates(df["decision_date"]),
+        }
     )
 
-    df["decision_date"] = pd.to_datetime(df["decision_date"])
 
-    df["type"] = df["type"].apply(lambda t: TYPES.get(t, "Autre"))
-    df["source"] = df["source"].apply(lambda source: SOURCES.get(source, "Autre"))
+def group_sum(
+    df: pd.DataFrame, keys: list[str], value: str = "n_decisions", engine: str = None
+):
+    """Sums `value` per group of `keys`, sorted by keys.
+
+    Only observed groups and categories are kept, so that grouping on
+    categorical columns does not produce the cartesian product of their
+    categories. The groups are computed by the aggregation `engine`, by default
+    the one of the AGGREGATION_ENGINE environment variable.
+    """
+    df = aggregate(df, keys, value=value, engine=engine).sort_values(
+        keys, ignore_index=True
+    )
 
-    df.loc[df["nac"].isna(), "nac"] = "Non renseigné"
+    for key in keys:
+        if isinstance(df[key].dtype, CategoricalDtype):
+            df[key] = df[key].cat.remove_unused_categories()
 
-    df["n_decisions"] = 1
+    return df
 
-    df = (
-        df.groupby(
-            [
-                "source",
-                "jurisdiction",
-                "court",
-                "location",
-                "nac",
-                "formation_clean",
-                "type",
-                "decision_date",
-            ]
-        )
-        .agg({"n_decisions": "sum"})
-        .reset_index()
+
+def group_data(df: pd.DataFrame, engine: str = None):
+    return (
+        aggregate(df, CUBE_DIMENSIONS, engine=engine)
+        .rename(columns={"size": "n_decisions"})
+        .astype({"n_decisions": "int32"})
+        .sort_values(CUBE_SORT_ORDER, ignore_index=True)
     )
 
+
+def merge_nac(df: pd.DataFrame, df_nac: pd.DataFrame):
+    nac_dtype = df["nac"].dtype
+
+    df_nac = df_nac.astype({c: "category" for c in NAC_LABEL_COLUMNS})
+
     df = pd.merge(
         left=df, right=df_nac, how="left", left_on=["nac"], right_on=["Code NAC"]
     )
+    df["nac"] = df["nac"].astype(nac_dtype)
+
+    return df
+
+
+def load_data(
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    nac_reference_filename: str = "nac_reference.csv",
+    timings: dict = None,
+    jurisdictions: list[str] = None,
+    start_date=None,
+    end_date=None,
+):
+    """Computes the cube from the decisions, possibly restricted to some
+    jurisdictions (such as ["ca"]) and to the decisions rendered between two
+    dates.
+
+    The duration of each stage (read, clean, groupby, merge) is stored in
+    `timings` when given.
+    """
+    timings = {} if timings is None else timings
+
+    start = time.perf_counter()
+    df, df_nac = read_data(
+        path=path,
+        main_filename=main_filename,
+        nac_reference_filename=nac_reference_filename,
+        jurisdictions=jurisdictions,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    timings["read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df = clean_data(df)
+    timings["clean"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df = group_data(df)
+    timings["groupby"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df = merge_nac(df, df_nac)
+    timings["merge"] = time.perf_counter() - start
 
     return df
 
 
+def slice_dates(df: pd.DataFrame, start_date=None, end_date=None):
+    """Returns the lines of a cube sorted by decision date between two dates.
+
+    Both dates are included. The bounds are found by binary search and the
+    result is a view on the cube, so it must not be modified in place.
+    """
+    dates = df["decision_date"].to_numpy()
+
+    start = 0
+    if start_date is not None:
+        start = dates.searchsorted(pd.Timestamp(start_date).to_datetime64())
+
+    end = len(dates)
+    if end_date is not None:
+        end = dates.searchsorted(pd.Timestamp(end_date).to_datetime64(), side="right")
+
+    return df.iloc[start:end]
+
+
 def get_download_data(
     df: pd.DataFrame,
     choice: str = "ca_location",
+    path: str = ".",
     # start_date: datetime.date = datetime.date(year=2000, month=1, day=1),
     # end_date: datetime.date = datetime.date.today(),
 ):
     if choice == "ca_location":
         df = (
             df.loc[df["jurisdiction"] == "Cours d'appel"]
-            .rename(columns=CLEAN_COLUMN_NAMES)
-            .groupby(["Cour"])
-            .agg({"Nombre de décisions": "sum"})
+            .rename(
+                columns={**CLEAN_COLUMN_NAMES, "n_decisions": "Nombre de décisions"}
+            )
+            .pipe(group_sum, ["Cour"], "Nombre de décisions")
+            .set_index(["Cour"])
         )
     elif choice == "ca_nac":
         df = (
             df.loc[df["jurisdiction"] == "Cours d'appel"]
-            .rename(columns=CLEAN_COLUMN_NAMES)
-            .groupby(["Code NAC", "Intitulé NAC"])
-            .agg({"Nombre de décisions": "sum"})
+            .rename(
+                columns={**CLEAN_COLUMN_NAMES, "n_decisions": "Nombre de décisions"}
+            )
+            .pipe(group_sum, ["Code NAC", "Intitulé NAC"], "Nombre de décisions")
+            .set_index(["Code NAC", "Intitulé NAC"])
         )
     elif choice == "ca_location_nac":
         df = (
             df.loc[df["jurisdiction"] == "Cours d'appel"]
             .rename(columns={"n_decisions": "Nombre de décisions", "court": "Cour"})
-            .groupby(["Cour", "Code NAC", "Intitulé NAC"])
-            .agg({"Nombre de décisions": "sum"})
+            .pipe(
+                group_sum, ["Cour", "Code NAC", "Intitulé NAC"], "Nombre de décisions"
+            )
+            .set_index(["Cour", "Code NAC", "Intitulé NAC"])
         )
     elif choice == "all_ids":
-        df = pd.read_parquet("./full_date.parquet")
-        df = df[["id"]].set_index("id")
+        index = open_id_index(path=path)
+        if index is None:
+            raise FileNotFoundError(f"The id index of {path} is not built yet")
+        ids = index.get_ids().astype(str)
+        df = pd.DataFrame(index=pd.Index(ids, name="id"))
     else:
         df = (
             df.rename(CLEAN_COLUMN_NAMES)
@@ -115,7 +325,8 @@ def get_download_data(
 def aggregate_data(path_to_raw_data: str):
     dfs = []
     for f in os.listdir(path_to_raw_data):
-        if ".parquet" in f:
+        # temporary files of exports in progress start with a dot
+        if f.endswith(".parquet") and not f.startswith("."):
             dfs.append(pd.read_parquet(os.path.join(path_to_raw_data, f)))
 
     return pd.concat(dfs)
@@ -0,0 +1,123 @@
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import CategoricalDtype
+
+from .load_data import aggregate_data
+from .load_data import CUBE_SORT_ORDER
+from .load_data import load_data
+
+# to increment whenever the columns or types of the cube change
+CUBE_SCHEMA_VERSION = "2"
+CUBE_SCHEMA_VERSION_KEY = b"judilibre_cube_schema_version"
+
+
+def get_cube_schema_version(cube_file: str):
+    """Returns the schema version of a cube file, None if it has no version"""
+    metadata = pq.read_schema(cube_file).metadata or {}
+    version = metadata.get(CUBE_SCHEMA_VERSION_KEY)
+    return version.decode() if version is not None else None
+
+
+def is_cube_up_to_date(cube_file: str):
+    return (
+        os.path.exists(cube_file)
+        and get_cube_schema_version(cube_file) == CUBE_SCHEMA_VERSION
+    )
+
+
+def write_cube(df: pd.DataFrame, cube_file: str):
+    """Writes the cube with its schema version, replacing the file atomically"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            CUBE_SCHEMA_VERSION_KEY: CUBE_SCHEMA_VERSION.encode(),
+        }
+    )
+
+    temporary_file = f"{cube_file}.tmp"
+    pq.write_table(table, temporary_file)
+    os.replace(temporary_file, cube_file)
+
+
+def materialize_data(
+    path: str = ".",
+    main_filename: str = "full_data.parquet",
+    nac_reference_filename: str = "nac_reference.csv",
+    cube_filename: str = "cube.parquet",
+    timings: dict = None,
+):
+    """Computes the cube from the decisions and writes it next to them"""
+    df = load_data(
+        path=path,
+        main_filename=main_filename,
+        nac_reference_filename=nac_reference_filename,
+        timings=timings,
+    )
+
+    cube_file = os.path.join(path, cube_filename)
+    write_cube(df, cube_file)
+
+    logging.info(f"Materialized {df.shape[0]} lines in {cube_file}")
+
+    return df
+
+
+def load_cube(path: str = ".", cube_filename: str = "cube.parquet"):
+    """Reads a materialized cube, checking its schema version"""
+    cube_file = os.path.join(path, cube_filename)
+
+    version = get_cube_schema_version(cube_file)
+    if version != CUBE_SCHEMA_VERSION:
+        raise ValueError(
+            f"{cube_file} has schema version {version}, "
+            f"expected {CUBE_SCHEMA_VERSION}: it should be materialized again"
+        )
+
+    df = pd.read_parquet(cube_file)
+
+    if not df["decision_date"].is_monotonic_increasing:
+        df = df.sort_values(CUBE_SORT_ORDER, ignore_index=True)
+
+    # keeping categories sorted, grouping on them relies on it
+    for column in df.columns:
+        if isinstance(df[column].dtype, CategoricalDtype):
+            df[column] = df[column].cat.reorder_categories(
+                sorted(df[column].cat.categories)
+            )
+
+    return df
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    argument_parser = ArgumentParser()
+
+    argument_parser.add_argument(
+        "-p", "--path", default="./data", help="Folder containing the data"
+    )
+    argument_parser.add_argument(
+        "-r",
+        "--raw-data-path",
+        default=None,
+        help="Folder of raw parquet files to aggregate into the main file first",
+    )
+    argument_parser.add_argument(
+        "-v", "--verbose", help="Debug level of verbose", action="store_true"
+    )
+
+    arguments = argument_parser.parse_args()
+
+    if arguments.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    if arguments.raw_data_path is not None:
+        df = aggregate_data(path_to_raw_data=arguments.raw_data_path)
+        df.to_parquet(os.path.join(arguments.path, "full_data.parquet"), index=False)
+
+    materialize_data(path=arguments.path)
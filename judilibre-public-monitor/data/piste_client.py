@@ -0,0 +1,253 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# requests per second allowed by the PISTE quota of the application
+PISTE_API_RATE = float(os.environ.get("PISTE_API_RATE", 10))
+
+THROTTLING_STATUS_CODES = [429, 503]
+RETRYABLE_STATUS_CODES = [*THROTTLING_STATUS_CODES, 500, 502, 504]
+
+
+def get_session(pool_size: int = 10):
+    """Returns a session keeping up to `pool_size` connections alive"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def close_response(future):
+    """Closes the response of a request whose answer is not used, releasing its
+    connection"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate adapts to throttling responses.
+
+    The rate is halved whenever the API throttles a request and grows back
+    linearly after each success, by `increase_step` requests per second
+    (a twentieth of the maximal rate by default).
+    """
+
+    def __init__(
+        self,
+        rate: float = PISTE_API_RATE,
+        capacity: float = None,
+        min_rate: float = 0.1,
+        increase_step: float = None,
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.min_rate = min_rate
+        self.increase_step = increase_step if increase_step is not None else rate / 20
+
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+    def acquire(self):
+        """Blocks until a token is available and consumes it"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+    def decrease(self):
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+    def increase(self):
+        with self._lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+
+class PisteClient:
+    """Client of the Judilibre API shared between download threads.
+
+    Requests go through an adaptive token bucket and have connect and read
+    timeouts. Throttled, failed and timed out requests are retried with an
+    exponential backoff and full jitter, within `max_retries` per request and
+    a retry budget of `retry_ratio` retries per request sent by the client.
+    If `hedge_after` is set, a second identical request is sent when the first
+    one has not answered after `hedge_after` seconds, and the first answer wins.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        headers: dict,
+        rate: float = PISTE_API_RATE,
+        connect_timeout: float = 5,
+        read_timeout: float = 60,
+        max_retries: int = 5,
+        retry_ratio: float = 0.2,
+        min_retries: int = 10,
+        backoff_base: float = 1,
+        backoff_max: float = 60,
+        hedge_after: float = None,
+        pool_size: int = 10,
+    ):
+        self.base_url = base_url
+        self.headers = headers
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_ratio = retry_ratio
+        self.min_retries = min_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+
+        self.bucket = TokenBucket(rate=rate)
+        self.session = get_session(pool_size=pool_size * (2 if hedge_after else 1))
+        self._hedge_executor = (
+            ThreadPoolExecutor(max_workers=2 * pool_size) if hedge_after else None
+        )
+
+        self._lock = threading.Lock()
+        self.n_requests = 0
+        self.n_retries = 0
+        self.n_throttled = 0
+        self.n_hedged = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.n_requests,
+                "retries": self.n_retries,
+                "throttled": self.n_throttled,
+                "hedged": self.n_hedged,
+                "rate": self.bucket.rate,
+            }
+
+    def _send(self, url: str, params: dict):
+        self.bucket.acquire()
+        with self._lock:
+            self.n_requests += 1
+        return self.session.get(
+            url=url, headers=self.headers, params=params, timeout=self.timeout
+        )
+
+    def _send_hedged(self, url: str, params: dict):
+        futures = [self._hedge_executor.submit(self._send, url, params)]
+
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            with self._lock:
+                self.n_hedged += 1
+            futures.append(self._hedge_executor.submit(self._send, url, params))
+
+        error = None
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except requests.RequestException as e:
+                error = e
+                continue
+            for other in futures:
+                if other is not future:
+                    other.cancel()
+                    other.add_done_callback(close_response)
+            return response
+        raise error
+
+    def _can_retry(self, attempt: int):
+        with self._lock:
+            budget = self.min_retries + self.retry_ratio * self.n_requests
+            if attempt >= self.max_retries or self.n_retries >= budget:
+                return False
+            self.n_retries += 1
+            return True
+
+    def _get_backoff(self, attempt: int, response: requests.Response = None):
+        retry_after = None
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            return min(self.backoff_max, int(retry_after))
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+
+    def get(self, endpoint: str, params: dict):
+        """Returns the JSON answer of the API to a GET request on `endpoint`"""
+        url = f"{self.base_url}/{endpoint}"
+        # the caller may update its parameters while a hedged request still waits
+        params = dict(params)
+        send = self._send_hedged if self.hedge_after else self._send
+
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = send(url, params)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logging.debug(f"Request to {url} failed: {e}")
+                error = e
+            else:
+                if response.status_code == 200:
+                    self.bucket.increase()
+                    return response.json()
+
+                logging.debug(
+                    f"Request received a non 200 status code {response.status_code}"
+                )
+                if response.status_code in THROTTLING_STATUS_CODES:
+                    with self._lock:
+                        self.n_throttled += 1
+                    self.bucket.decrease()
+                error = requests.HTTPError(
+                    f"Status code {response.status_code}", response=response
+                )
+                response.close()
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise error
+
+            if not self._can_retry(attempt):
+                raise requests.exceptions.RetryError(
+                    f"Giving up on {url} after {attempt + 1} attempts"
+                ) from error
+
+            time.sleep(self._get_backoff(attempt, response))
+            attempt += 1
@@ -0,0 +1,106 @@
+import pandas as pd
+
+from .engines import aggregate
+from .load_data import slice_dates
+
+# dimensions kept by the time series graphs
+PYRAMID_DIMENSIONS = ["jurisdiction", "court", "location"]
+
+# levels of the pyramid, from the finest
+RESOLUTIONS = ["day", "month", "year"]
+
+NUMPY_UNITS = {
+    "day": "datetime64[D]",
+    "month": "datetime64[M]",
+    "year": "datetime64[Y]",
+}
+
+
+def truncate_dates(dates: pd.Series, resolution: str):
+    """Returns the first day of the day, month or year of each date"""
+    truncated = dates.to_numpy().astype(NUMPY_UNITS[resolution])
+    return pd.Series(truncated.astype("datetime64[ns]"), index=dates.index)
+
+
+def get_period_start(date: pd.Timestamp, resolution: str):
+    return pd.Timestamp(date.to_datetime64().astype(NUMPY_UNITS[resolution]))
+
+
+def get_next_period_start(date: pd.Timestamp, resolution: str):
+    offsets = {
+        "day": pd.DateOffset(days=1),
+        "month": pd.DateOffset(months=1),
+        "year": pd.DateOffset(years=1),
+    }
+    return get_period_start(date, resolution) + offsets[resolution]
+
+
+def roll_up(df: pd.DataFrame, resolution: str):
+    """Sums the decisions of a level of the pyramid per period of `resolution`,
+    sorted by date. The categories of the dimensions are kept."""
+    df = df.assign(decision_date=truncate_dates(df["decision_date"], resolution))
+    keys = ["decision_date", *PYRAMID_DIMENSIONS]
+    return aggregate(df, keys, value="n_decisions").sort_values(keys, ignore_index=True)
+
+
+def get_pyramid(df: pd.DataFrame):
+    """Returns the decisions of the cube per day, month and year, each level
+    being rolled up from the previous one"""
+    pyramid = {"day": roll_up(df, "day")}
+    for finer, resolution in zip(RESOLUTIONS, RESOLUTIONS[1:]):
+        pyramid[resolution] = roll_up(pyramid[finer], resolution)
+    return pyramid
+
+
+def get_rollup(pyramid: dict, resolution: str, start_date=None, end_date=None):
+    """Returns the decisions per period of `resolution` between two dates, both
+    included.
+
+    The periods entirely between the dates are read from their level of the
+    pyramid. The periods cut by a date only count the decisions between the
+    dates, read from the finer levels, so the result is the same as rolling up
+    the days between the dates.
+    """
+    level = pyramid[resolution]
+    if resolution == RESOLUTIONS[0] or (start_date is None and end_date is None):
+        return slice_dates(level, start_date=start_date, end_date=end_date)
+
+    start_date = None if start_date is None else pd.Timestamp(start_date)
+    end_date = None if end_date is None else pd.Timestamp(end_date)
+
+    # the full periods start from full_start included to full_end excluded
+    full_start = None
+    if start_date is not None:
+        full_start = get_period_start(start_date, resolution)
+        if full_start != start_date:
+            full_start = get_next_period_start(start_date, resolution)
+    full_end = None
+    if end_date is not None:
+        full_end = get_period_start(end_date + pd.Timedelta(days=1), resolution)
+
+    finer = RESOLUTIONS[RESOLUTIONS.index(resolution) - 1]
+
+    if full_start is not None and full_end is not None and full_start >= full_end:
+        return roll_up(get_rollup(pyramid, finer, start_date, end_date), resolution)
+
+    full_periods = slice_dates(
+        level,
+        start_date=full_start,
+        end_date=None if full_end is None else full_end - pd.Timedelta(days=1),
+    )
+
+    # both cut periods are rolled up at once
+    cut_periods = []
+    if start_date is not None and full_start != start_date:
+        cut_periods.append(
+            get_rollup(pyramid, finer, start_date, full_start - pd.Timedelta(days=1))
+        )
+    if end_date is not None and full_end <= end_date:
+        cut_periods.append(get_rollup(pyramid, finer, full_end, end_date))
+    if not cut_periods:
+        return full_periods
+
+    return pd.concat(
+        [full_periods, roll_up(pd.concat(cut_periods, ignore_index=True), resolution)],
+        ignore_index=True,
+    )
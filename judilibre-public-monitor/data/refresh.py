@@ -0,0 +1,170 @@
+import datetime
+import fcntl
+import logging
+import os
+import threading
+import time
+import traceback
+
+from .dataset import get_id_index
+from .dataset import list_dataset_files
+from .download_latest_data import download_latest_data
+from .materialize_data import is_cube_up_to_date
+from .materialize_data import materialize_data
+
+
+def refresh_data(
+    path: str = ".",
+    api_key_id: str = "XXXXXX",
+    api_url: str = "https://sandbox-api.piste.gouv.fr/cassation/judilibre/v1.0",
+    max_workers: int = 4,
+    timings: dict = None,
+):
+    """Downloads the latest decisions then materializes the cube again.
+
+    Every file is replaced atomically, so readers either see the former or the
+    new version of the data. The durations of the stages of `load_data` are
+    stored in `timings` when given.
+    """
+    n_new_decisions = download_latest_data(
+        path=path, api_key_id=api_key_id, api_url=api_url, max_workers=max_workers
+    )
+    # the id index read by the application is only built here, under the lock
+    get_id_index(path=path)
+
+    # also materializing a cube left behind by an interrupted refresh
+    cube_file = os.path.join(path, "cube.parquet")
+    if (
+        n_new_decisions
+        or not is_cube_up_to_date(cube_file)
+        or os.path.getmtime(cube_file)
+        < max(os.path.getmtime(f) for f in list_dataset_files(path=path))
+    ):
+        materialize_data(path=path, timings=timings)
+
+    return n_new_decisions
+
+
+class RefreshWorker:
+    """Runs a refresh function periodically in a background thread.
+
+    A lock on `lock_file` prevents several processes serving the application
+    from refreshing the same data at the same time. The lock is an `flock` held
+    for the whole refresh, released by the system if the process dies, so it
+    neither goes stale nor expires during a long refresh.
+    """
+
+    def __init__(
+        self,
+        refresh,
+        interval: float = 24 * 60 * 60,
+        lock_file: str = None,
+    ):
+        self.refresh = refresh
+        self.interval = interval
+        self.lock_file = lock_file
+        self._lock_fd = None
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+        self.n_runs = 0
+        self.last_run_start = None
+        self.last_run_duration = None
+        self.last_status = None
+        self.last_error = None
+        self.last_result = None
+        self.next_run = None
+
+    def _acquire_lock(self):
+        if self.lock_file is None:
+            return True
+
+        # the file itself is never removed, another process may be locking it
+        fd = os.open(self.lock_file, os.O_CREAT | os.O_WRONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._lock_fd = fd
+        return True
+
+    def _release_lock(self):
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def run_once(self):
+        """Runs the refresh function, unless another process is running it"""
+        if not self._acquire_lock():
+            logging.info("Data refresh already running in another process")
+            with self._lock:
+                self.last_status = "skipped"
+            return
+
+        start = time.perf_counter()
+        with self._lock:
+            self.last_run_start = datetime.datetime.now()
+
+        try:
+            result = self.refresh()
+            status, error = "success", None
+        except Exception:
+            result = None
+            status, error = "error", traceback.format_exc()
+            logging.exception("Data refresh failed")
+        finally:
+            self._release_lock()
+
+        with self._lock:
+            self.n_runs += 1
+            self.last_run_duration = time.perf_counter() - start
+            self.last_status = status
+            self.last_error = error
+            self.last_result = result
+
+        logging.info(
+            f"Data refresh ended with status {status} "
+            f"in {self.last_run_duration:.1f}s"
+        )
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.run_once()
+            with self._lock:
+                self.next_run = datetime.datetime.now() + datetime.timedelta(
+                    seconds=self.interval
+                )
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="data-refresh", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def status(self):
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "interval": self.interval,
+                "n_runs": self.n_runs,
+                "last_run_start": self.last_run_start,
+                "last_run_duration": self.last_run_duration,
+                "last_status": self.last_status,
+                "last_error": self.last_error,
+                "last_result": self.last_result,
+                "next_run": self.next_run,
+            }
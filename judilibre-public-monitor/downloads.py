@@ -0,0 +1,112 @@
+import io
+import itertools
+import zlib
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# lines serialized at once, the memory used by a download not depending on its size
+DOWNLOAD_CHUNK_SIZE = 50_000
+
+DOWNLOAD_CHOICES = {
+    "ca_location": "Nombre de décisions par cour d'appel",
+    "ca_nac": "Nombre de décisions par code NAC",
+    "ca_location_nac": "Nombre de décisions par cour d'appel et code NAC",
+    "all_data": "Données complètes agrégées",
+    "all_ids": "Identifiants des décisions",
+}
+
+
+class ChunkSink(io.RawIOBase):
+    """File in which pyarrow writers write, the bytes written being taken out
+    after each chunk instead of being kept until the end of the file"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_chunks(df: pd.DataFrame, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+    """Yields the lines of `df` by chunks, at least one chunk being yielded"""
+    for start in range(0, max(len(df), 1), chunk_size):
+        yield df.iloc[start : start + chunk_size]
+
+
+def iter_id_chunks(index, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+    """Yields the ids of an `IdIndex` by chunks, as DataFrames indexed by id"""
+    for ids in index.iter_ids(chunk_size=chunk_size):
+        yield pd.DataFrame(index=pd.Index(ids, name="id"))
+
+
+def iter_csv(chunks):
+    """Yields the bytes of the CSV file of DataFrame chunks, as `df.to_csv()`"""
+    for i, chunk in enumerate(chunks):
+        yield chunk.to_csv(header=i == 0).encode("utf-8")
+
+
+def iter_csv_gzip(chunks):
+    """Yields the gzip-compressed bytes of the CSV file of DataFrame chunks"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for data in iter_csv(chunks):
+        yield compressor.compress(data)
+    yield compressor.flush()
+
+
+def iter_arrow_file(chunks, new_writer):
+    chunks = iter(chunks)
+    first_chunk = next(chunks)
+    schema = pa.Schema.from_pandas(first_chunk)
+
+    sink = ChunkSink()
+    with new_writer(sink, schema) as writer:
+        for chunk in itertools.chain([first_chunk], chunks):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+def iter_parquet(chunks):
+    """Yields the parquet file of DataFrame chunks, with a row group per chunk.
+    The index is kept, as with `df.to_parquet()`."""
+    return iter_arrow_file(chunks, pq.ParquetWriter)
+
+
+def iter_arrow(chunks):
+    """Yields the Arrow IPC file of DataFrame chunks, with a record batch per
+    chunk"""
+    return iter_arrow_file(chunks, pa.ipc.new_file)
+
+
+# extension of the file: content type and serializer
+DOWNLOAD_FORMATS = {
+    "csv": ("text/csv", iter_csv),
+    "csv.gz": ("application/gzip", iter_csv_gzip),
+    "parquet": ("application/vnd.apache.parquet", iter_parquet),
+    "arrow": ("application/vnd.apache.arrow.file", iter_arrow),
+}
+
+
+def parse_download_filename(filename: str):
+    """Returns the choice and the format of a file name such as
+    ca_location.csv.gz, or None if one of them is unknown"""
+    choice, _, data_format = filename.partition(".")
+    if choice not in DOWNLOAD_CHOICES or data_format not in DOWNLOAD_FORMATS:
+        return None
+    return choice, data_format
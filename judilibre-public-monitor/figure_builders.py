@@ -0,0 +1,197 @@
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+
+# layout shared by every figure, on top of the default plotly template
+BASE_LAYOUT = {
+    "plot_bgcolor": "rgba(0,0,0,0)",
+    "legend": {"tracegroupgap": 0},
+    "margin": {"t": 60},
+}
+
+# colors of the default plotly template, used by plotly express as well
+DEFAULT_COLORS = qualitative.Plotly
+
+
+def get_label(column: str, labels: dict):
+    return labels.get(column, column)
+
+
+def get_custom_columns(x: str, y: str, hover_data: list[str]):
+    return [column for column in hover_data if column not in [x, y]]
+
+
+def get_hover_template(
+    x: str,
+    y: str,
+    color: str = None,
+    color_value=None,
+    hover_data: list[str] = [],
+    labels: dict = {},
+):
+    """Returns the hover template of a trace, listing the same fields as plotly
+    express: the color, x, y then the other hover columns"""
+    custom_columns = get_custom_columns(x, y, hover_data)
+
+    def get_field(column: str):
+        if column == x:
+            return "%{x}"
+        if column in custom_columns:
+            return f"%{{customdata[{custom_columns.index(column)}]}}"
+        return color_value
+
+    columns = [x, y, *custom_columns]
+    if color is not None and color != x:
+        columns = [color] + [column for column in columns if column != color]
+
+    fields = [
+        f"{get_label(column, labels)}={get_field(column) if column != y else '%{y}'}"
+        for column in columns
+    ]
+    return "<br>".join(fields) + "<extra></extra>"
+
+
+def get_groups(df: pd.DataFrame, color: str = None):
+    """Yields the value of the color column and the lines of each trace, in the
+    order of appearance of the values"""
+    if color is None:
+        yield None, df
+        return
+
+    codes, values = pd.factorize(df[color])
+    for i, value in enumerate(values):
+        yield value, df[codes == i]
+
+
+def get_traces(
+    trace_type,
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    color: str = None,
+    color_discrete_map: dict = {},
+    color_discrete_sequence: list[str] = DEFAULT_COLORS,
+    hover_data: list[str] = [],
+    labels: dict = {},
+):
+    """Returns one bar or line trace per value of the color column"""
+    custom_columns = get_custom_columns(x, y, hover_data)
+
+    traces = []
+    for i, (value, df_group) in enumerate(get_groups(df, color)):
+        name = "" if value is None else value
+        trace_color = color_discrete_map.get(
+            value, color_discrete_sequence[i % len(color_discrete_sequence)]
+        )
+
+        trace = {
+            "x": df_group[x].to_numpy(),
+            "y": df_group[y].to_numpy(),
+            "name": name,
+            "legendgroup": name,
+            "showlegend": value is not None,
+            "hovertemplate": get_hover_template(
+                x,
+                y,
+                color=color,
+                color_value=value,
+                hover_data=hover_data,
+                labels=labels,
+            ),
+        }
+        if custom_columns:
+            trace["customdata"] = df_group[custom_columns].to_numpy()
+
+        if trace_type is go.Bar:
+            trace.update(
+                marker_color=trace_color,
+                alignmentgroup="True",
+                offsetgroup=name,
+                orientation="v",
+            )
+        else:
+            trace.update(mode="lines", line_color=trace_color)
+
+        traces.append(trace_type(**trace))
+
+    return traces
+
+
+def get_axes_layout(x: str, y: str, color: str = None, labels: dict = {}):
+    layout = {
+        "xaxis": {"title": {"text": get_label(x, labels)}},
+        "yaxis": {"title": {"text": get_label(y, labels)}},
+        "legend": dict(BASE_LAYOUT["legend"]),
+    }
+    if color is not None:
+        layout["legend"]["title"] = {"text": get_label(color, labels)}
+    return layout
+
+
+def make_figure(traces: list, layout: dict):
+    return go.Figure(data=traces, layout={**BASE_LAYOUT, **layout})
+
+
+def bar(
+    data_frame: pd.DataFrame,
+    x: str,
+    y: str,
+    color: str = None,
+    color_discrete_map: dict = {},
+    color_discrete_sequence: list[str] = DEFAULT_COLORS,
+    hover_data: list[str] = [],
+    labels: dict = {},
+    barmode: str = "relative",
+):
+    """Returns a bar chart looking like the one of `px.bar` with the same
+    arguments, built from graph objects"""
+    traces = get_traces(
+        go.Bar,
+        data_frame,
+        x,
+        y,
+        color=color,
+        color_discrete_map=color_discrete_map,
+        color_discrete_sequence=color_discrete_sequence,
+        hover_data=hover_data,
+        labels=labels,
+    )
+
+    layout = get_axes_layout(x, y, color=color, labels=labels)
+    layout["barmode"] = barmode
+    if color is not None and color == x:
+        layout["xaxis"].update(
+            categoryorder="array", categoryarray=[trace.name for trace in traces]
+        )
+
+    return make_figure(traces, layout)
+
+
+def line(
+    data_frame: pd.DataFrame,
+    x: str,
+    y: str,
+    color: str = None,
+    color_discrete_map: dict = {},
+    color_discrete_sequence: list[str] = DEFAULT_COLORS,
+    labels: dict = {},
+    range_x: list = None,
+):
+    """Returns a line chart looking like the one of `px.line` with the same
+    arguments, built from graph objects"""
+    traces = get_traces(
+        go.Scatter,
+        data_frame,
+        x,
+        y,
+        color=color,
+        color_discrete_map=color_discrete_map,
+        color_discrete_sequence=color_discrete_sequence,
+        labels=labels,
+    )
+
+    layout = get_axes_layout(x, y, color=color, labels=labels)
+    if range_x is not None:
+        layout["xaxis"]["range"] = range_x
+
+    return make_figure(traces, layout)
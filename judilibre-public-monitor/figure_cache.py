@@ -0,0 +1,114 @@
+import json
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def normalize_date(date):
+    return None if date is None else pd.Timestamp(date).date().isoformat()
+
+
+def make_key(graph_id: str, start_date=None, end_date=None, locations=None):
+    """Returns a cache key of a figure from the inputs of its callback"""
+    return (
+        graph_id,
+        normalize_date(start_date),
+        normalize_date(end_date),
+        tuple(sorted(locations)) if locations is not None else None,
+    )
+
+
+class FigureCache:
+    """Thread-safe LRU cache of serialized figures for one version of the data.
+
+    Figures are stored as JSON strings and evicted, least recently used first,
+    when the cache holds more than `max_bytes` bytes. `get_version` returns the
+    current version of the data, such as the one of the data cache, and the
+    cache is emptied when it changes. Figures of another version, requested or
+    built while the data was reloaded, are never returned nor stored. Without
+    `get_version`, the version of the latest `get` is the current one.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, get_version=None):
+        self.max_bytes = max_bytes
+        self.get_version = get_version
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _set_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self.n_bytes = 0
+            self._version = version
+
+    def _is_current(self, version):
+        """Switches to the current version of the data, then returns whether
+        `version` is it. The lock must be held."""
+        if self.get_version is not None:
+            self._set_version(self.get_version())
+        return version == self._version
+
+    def get(self, version, key):
+        """Returns the serialized figure of `key`, None if it is not cached or
+        if `version` is not the current version of the data"""
+        with self._lock:
+            if self.get_version is None:
+                self._set_version(version)
+            if self._is_current(version) and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, version, key, value: str):
+        """Stores a serialized figure, unless it was built from another version
+        than the current one"""
+        size = sys.getsizeof(value)
+        with self._lock:
+            if not self._is_current(version) or size > self.max_bytes:
+                return
+            if key in self._entries:
+                self.n_bytes -= sys.getsizeof(self._entries.pop(key))
+            self._entries[key] = value
+            self.n_bytes += size
+            while self.n_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.n_bytes -= sys.getsizeof(evicted)
+                self.evictions += 1
+
+    def get_or_build(self, version, key, build):
+        """Returns the cached figure of `key`, calling `build` on a miss"""
+        value = self.get(version, key)
+        if value is None:
+            value = build().to_json()
+            self.put(version, key, value)
+        return json.loads(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            n_requests = self.hits + self.misses
+            return {
+                "version": self._version,
+                "entries": len(self._entries),
+                "bytes": self.n_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / n_requests if n_requests else None,
+                "evictions": self.evictions,
+            }
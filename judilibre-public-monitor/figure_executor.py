@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+from data.cache import get_data_cache
+from data.load_data import slice_dates
+from data.pyramid import get_pyramid
+from graphs import get_chamber_graph
+from graphs import get_formation_time_graph
+from graphs import get_location_graph
+from graphs import get_nac_graph
+from graphs import get_nac_level_graph
+from graphs import get_nac_level_location_graph
+from graphs import get_nac_location_graph
+from graphs import get_source_graph
+from graphs import get_time_graph
+from graphs import get_time_location_graph
+from graphs import get_type_graph
+
+GRAPH_BUILDERS = {
+    "source-graph": get_source_graph,
+    "time-graph": get_time_graph,
+    "location-graph": get_location_graph,
+    "nac-graph": get_nac_graph,
+    "chamber-graph": get_chamber_graph,
+    "type-graph": get_type_graph,
+    "nac-level-graph": get_nac_level_graph,
+    "formation-time-graph": get_formation_time_graph,
+    "time-location-graph": get_time_location_graph,
+    "nac-location-graph": get_nac_location_graph,
+    "level-location-graph": get_nac_level_location_graph,
+}
+
+# graphs reading the time pyramid of the cube instead of its lines
+PYRAMID_GRAPH_IDS = ["time-graph", "time-location-graph", "formation-time-graph"]
+
+EXECUTOR_KINDS = ["thread", "process"]
+
+
+def build_figure(
+    df,
+    graph_id: str,
+    start_date=None,
+    end_date=None,
+    locations=None,
+    pyramid: dict = None,
+):
+    """Builds a figure from the cube, or from its time pyramid for the time
+    series graphs, computing the pyramid if it is not given"""
+    kwargs = {"locations": locations} if locations is not None else {}
+
+    if graph_id not in PYRAMID_GRAPH_IDS:
+        df = slice_dates(df, start_date=start_date, end_date=end_date)
+        return GRAPH_BUILDERS[graph_id](df=df, **kwargs)
+
+    if pyramid is None:
+        pyramid = get_pyramid(df)
+    return GRAPH_BUILDERS[graph_id](
+        pyramid=pyramid, start_date=start_date, end_date=end_date, **kwargs
+    )
+
+
+def render_figure(
+    path: str, graph_id: str, start_date=None, end_date=None, locations=None
+):
+    """Builds a figure from the cube of `path` and returns it serialized.
+
+    The cube and its time pyramid come from the data cache of the calling
+    process, so threads share them with the application and each worker process
+    computes them once per version of the data. Returns the version of the data
+    used and the duration of the build with the figure.
+    """
+    data_cache = get_data_cache(path=path)
+    df, version = data_cache.get_versioned()
+    pyramid = None
+    if graph_id in PYRAMID_GRAPH_IDS:
+        pyramid = data_cache.get_derived("pyramid", get_pyramid)
+
+    start = time.perf_counter()
+    figure = build_figure(
+        df,
+        graph_id,
+        start_date=start_date,
+        end_date=end_date,
+        locations=locations,
+        pyramid=pyramid,
+    ).to_json()
+    return version, figure, time.perf_counter() - start
+
+
+def get_figure_executor(kind: str = "thread", max_workers: int = None):
+    """Returns the executor running the figure builders.
+
+    Threads share the cube but are limited by the GIL while plotly builds the
+    figures. Processes build figures truly in parallel at the cost of one copy
+    of the cube per worker. They are spawned rather than forked, as the
+    application already runs threads when the first figure is built.
+    """
+    if kind not in EXECUTOR_KINDS:
+        raise ValueError(f"Unknown executor {kind}, expected one of {EXECUTOR_KINDS}")
+
+    max_workers = max_workers or min(len(GRAPH_BUILDERS), os.cpu_count() or 1)
+
+    if kind == "process":
+        return ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="figures")
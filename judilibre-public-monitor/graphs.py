@@ -1,18 +1,17 @@
-import datetime
-
 import pandas as pd
-import plotly.express as px
+from data.load_data import group_sum
+from data.pyramid import get_rollup
+from figure_builders import bar
+from figure_builders import line
 from palettes import COLORS
 from palettes import PALETTES
 
 
 def get_source_graph(df: pd.DataFrame):
     """Returns a graph of decisions per source and jurisidiction"""
-    df_source = (
-        df.groupby(["source", "jurisdiction"]).agg({"n_decisions": "sum"}).reset_index()
-    )
+    df_source = group_sum(df, ["source", "jurisdiction"])
 
-    fig = px.bar(
+    fig = bar(
         data_frame=df_source,
         x="source",
         y="n_decisions",
@@ -28,81 +27,107 @@ def get_source_graph(df: pd.DataFrame):
         },
     )
 
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
-
     return fig
 
 
+# arguments of the figures filtered by dates, also rendered in the browser by
+# assets/clientside_filtering.js
+LOCATION_GRAPH = {
+    "x": "location",
+    "y": "n_decisions",
+    "color_discrete_sequence": [
+        COLORS["bleu_france"],
+    ],
+    "labels": {"location": "Cour d'appel", "n_decisions": "Nombre de décisions"},
+}
+
+NAC_GRAPH = {
+    "x": "nac",
+    "y": "n_decisions",
+    "color": "Niveau 1",
+    "color_discrete_sequence": PALETTES["pal_gouv_qual1"],
+    "hover_data": ["n_decisions", "nac", "Intitulé NAC", "Niveau 1"],
+    "labels": {
+        "n_decisions": "Nombre de décisions",
+        "nac": "Code Nature Affaire Civile",
+    },
+}
+
+CHAMBER_GRAPH = {
+    "x": "formation_clean",
+    "y": "n_decisions",
+    "labels": {
+        "formation_clean": "Formation ou chambre",
+        "n_decisions": "Nombre de décisions",
+    },
+    "color_discrete_sequence": [COLORS["rouge_marianne"]],
+}
+
+TYPE_GRAPH = {
+    "x": "type",
+    "y": "n_decisions",
+    "labels": {"type": "Type de décision", "n_decisions": "Nombre de décisions"},
+    "color_discrete_sequence": [COLORS["rouge_marianne"]],
+}
+
+NAC_LEVEL_GRAPH = {
+    "x": "Niveau 1",
+    "y": "n_decisions",
+    "color": "Niveau 1",
+    "hover_data": ["n_decisions", "Niveau 1", "Niveau 2"],
+    "color_discrete_sequence": PALETTES["pal_gouv_qual1"],
+    "labels": {"n_decisions": "Nombre de décisions"},
+}
+
+FORMATION_TIME_GRAPH = {
+    "x": "Mois",
+    "y": "Nombre de décisions",
+    "color_discrete_sequence": [COLORS["rouge_marianne"], COLORS["bleu_france"]],
+}
+
+FORMATION_TIME_SMOOTHED_GRAPH = {
+    "x": "Mois",
+    "y": "Nombre de décisions lissé",
+    "color_discrete_sequence": [COLORS["bleu_france"]],
+}
+
+# months of the rolling mean of the formation time graph
+FORMATION_TIME_WINDOW = 12
+
+
 def get_location_graph(df: pd.DataFrame):
     """Returns a graph of decisions per location (cours d'appel)"""
-    df_location = (
-        df.loc[df["jurisdiction"] == "Cours d'appel"]
-        .groupby(["location"])
-        .agg({"n_decisions": "sum"})
-        .reset_index()
-    )
+    df_location = group_sum(df.loc[df["jurisdiction"] == "Cours d'appel"], ["location"])
 
-    fig = px.bar(
-        data_frame=df_location,
-        x="location",
-        y="n_decisions",
-        color_discrete_sequence=[
-            COLORS["bleu_france"],
-        ],
-        labels={"location": "Cour d'appel", "n_decisions": "Nombre de décisions"},
-    )
-
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
+    fig = bar(data_frame=df_location, **LOCATION_GRAPH)
 
     return fig
 
 
 def get_nac_graph(df: pd.DataFrame):
     """Returns a graph of decisions per code NAC (cours d'appel)"""
-    df_nac = (
-        df.loc[df["jurisdiction"] == "Cours d'appel"]
-        .groupby(["nac", "Niveau 1", "N1", "Intitulé NAC"])
-        .agg({"n_decisions": "sum"})
-        .reset_index()
+    df_nac = group_sum(
+        df.loc[df["jurisdiction"] == "Cours d'appel"],
+        ["nac", "Niveau 1", "N1", "Intitulé NAC"],
     )
 
-    fig = px.bar(
+    fig = bar(
         data_frame=df_nac[df_nac["n_decisions"] != 0].sort_values(["N1", "nac"]),
-        x="nac",
-        y="n_decisions",
-        color="Niveau 1",
-        color_discrete_sequence=PALETTES["pal_gouv_qual1"],
-        hover_data=["n_decisions", "nac", "Intitulé NAC", "Niveau 1"],
-        labels={
-            "n_decisions": "Nombre de décisions",
-            "nac": "Code Nature Affaire Civile",
-        },
-    )
-
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
+        **NAC_GRAPH,
     )
 
     return fig
 
 
-def get_time_graph(df: pd.DataFrame):
-    """Returns a graph of decisions per year and jurisdiction"""
-    df_time = df.copy()
-
-    df_time["decision_year"] = df_time["decision_date"].dt.year
+def get_time_graph(pyramid: dict, start_date=None, end_date=None):
+    """Returns a graph of decisions per year and jurisdiction between two dates,
+    from the time pyramid of the cube"""
+    df_time = get_rollup(pyramid, "year", start_date=start_date, end_date=end_date)
+    df_time = df_time.assign(decision_year=df_time["decision_date"].dt.year)
 
-    df_time = (
-        df_time.groupby(["decision_year", "jurisdiction"])
-        .agg({"n_decisions": "sum"})
-        .reset_index()
-    )
+    df_time = group_sum(df_time, ["decision_year", "jurisdiction"])
 
-    fig = px.line(
+    fig = line(
         data_frame=df_time,
         x="decision_year",
         y="n_decisions",
@@ -119,33 +144,25 @@ def get_time_graph(df: pd.DataFrame):
         },
     )
 
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
-
     return fig
 
 
 def get_time_location_graph(
-    df: pd.DataFrame, locations: list[str] = ["Paris", "Versailles", "Aix-en-Provence"]
+    pyramid: dict,
+    locations: list[str] = ["Paris", "Versailles", "Aix-en-Provence"],
+    start_date=None,
+    end_date=None,
 ):
-    """Returns a graph of decisions per month and cour d'appel"""
-
-    df_time = df.copy()
+    """Returns a graph of decisions per month and cour d'appel between two
+    dates, from the time pyramid of the cube"""
+    df_time = get_rollup(pyramid, "month", start_date=start_date, end_date=end_date)
     df_time = df_time[df_time["location"].isin(locations)]
 
-    df_time["decision_date"] = df_time["decision_date"] - (
-        df_time["decision_date"].dt.day - 1
-    ) * datetime.timedelta(days=1)
-
-    df_time = (
-        df_time.groupby(["decision_date", "location", "court"])
-        .agg({"n_decisions": "sum"})
-        .reset_index()
-        .sort_values(by=["location", "decision_date"])
+    df_time = group_sum(df_time, ["decision_date", "location", "court"]).sort_values(
+        by=["location", "decision_date"]
     )
 
-    fig = px.line(
+    fig = line(
         data_frame=df_time,
         x="decision_date",
         y="n_decisions",
@@ -158,10 +175,6 @@ def get_time_location_graph(
         },
     )
 
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
-
     return fig
 
 
@@ -170,15 +183,14 @@ def get_nac_location_graph(
 ):
     """Returns a graph of decisions per Code NAC and cour d'appel"""
     df_nac = (
-        df.loc[df["location"].isin(locations)]
-        .groupby(["nac", "Intitulé NAC", "location"])
-        .agg({"n_decisions": "sum"})
-        .reset_index()
+        group_sum(
+            df.loc[df["location"].isin(locations)], ["nac", "Intitulé NAC", "location"]
+        )
         .dropna(subset=["nac"])
         .sort_values(by=["location", "nac"])
     )
 
-    fig = px.bar(
+    fig = bar(
         data_frame=df_nac,
         x="nac",
         y="n_decisions",
@@ -192,9 +204,6 @@ def get_nac_location_graph(
             "n_decisions": "Nombre de décisions",
         },
     )
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
 
     return fig
 
@@ -203,30 +212,9 @@ def get_chamber_graph(df: pd.DataFrame):
     """Returns a graph of decisions per formation (Cour de cassation)"""
     df = df[df["jurisdiction"] == "Cour de cassation"].copy()
 
-    df = (
-        df.groupby(
-            [
-                "formation_clean",
-            ]
-        )
-        .agg({"n_decisions": "sum"})
-        .reset_index()
-    )
+    df = group_sum(df, ["formation_clean"])
 
-    fig = px.bar(
-        data_frame=df,
-        x="formation_clean",
-        y="n_decisions",
-        labels={
-            "formation_clean": "Formation ou chambre",
-            "n_decisions": "Nombre de décisions",
-        },
-        color_discrete_sequence=[COLORS["rouge_marianne"]],
-    )
-
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
+    fig = bar(data_frame=df, **CHAMBER_GRAPH)
 
     return fig
 
@@ -235,59 +223,31 @@ def get_type_graph(df: pd.DataFrame):
     """Returns a graph of decisions per formation (Cour de cassation)"""
     df = df[df["jurisdiction"] == "Cour de cassation"].copy()
 
-    df = df.groupby("type").agg({"n_decisions": "sum"}).reset_index()
+    df = group_sum(df, ["type"])
 
-    fig = px.bar(
-        data_frame=df,
-        x="type",
-        y="n_decisions",
-        labels={"type": "Type de décision", "n_decisions": "Nombre de décisions"},
-        color_discrete_sequence=[COLORS["rouge_marianne"]],
-    )
+    fig = bar(data_frame=df, **TYPE_GRAPH)
 
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
     return fig
 
 
 def get_nac_level_graph(df: pd.DataFrame):
     """Returns a graph of decisions per NAC level (1 and 2) (Cours d'appel)"""
 
-    df_level = (
-        df.groupby(["Niveau 2", "N1", "Niveau 1"])
-        .agg({"n_decisions": "sum"})
-        .reset_index()
-    )
+    df_level = group_sum(df, ["Niveau 2", "N1", "Niveau 1"])
 
-    fig = px.bar(
-        data_frame=df_level.sort_values("N1"),
-        x="Niveau 1",
-        y="n_decisions",
-        color="Niveau 1",
-        hover_data=["n_decisions", "Niveau 1", "Niveau 2"],
-        color_discrete_sequence=PALETTES["pal_gouv_qual1"],
-        labels={"n_decisions": "Nombre de décisions"},
-    )
-
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
+    fig = bar(data_frame=df_level.sort_values("N1", kind="stable"), **NAC_LEVEL_GRAPH)
 
     return fig
 
 
 def get_nac_level_location_graph(df: pd.DataFrame, locations: list[str] = ["Paris"]):
     df_nac = (
-        df[df["location"].isin(locations)]
-        .groupby(["N1", "Niveau 1", "location"])
-        .agg({"n_decisions": "sum"})
-        .reset_index()
+        group_sum(df[df["location"].isin(locations)], ["N1", "Niveau 1", "location"])
         .dropna(subset=["N1", "Niveau 1"])
         .sort_values(by=["location", "N1"])
     )
 
-    fig = px.bar(
+    fig = bar(
         data_frame=df_nac,
         x="Niveau 1",
         y="n_decisions",
@@ -301,25 +261,19 @@ def get_nac_level_location_graph(df: pd.DataFrame, locations: list[str] = ["Pari
         },
     )
 
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
-
     return fig
 
 
-def get_formation_time_graph(df: pd.DataFrame):
-    df_time = df[df["jurisdiction"] == "Cour de cassation"].copy()
-    df_time["decision_date"] = df_time["decision_date"] - (
-        df_time["decision_date"].dt.day - 1
-    ) * datetime.timedelta(days=1)
+def get_formation_time_graph(pyramid: dict, start_date=None, end_date=None):
+    """Returns a graph of decisions per month of the Cour de cassation between
+    two dates, from the time pyramid of the cube"""
+    df_time = get_rollup(pyramid, "month", start_date=start_date, end_date=end_date)
+    df_time = df_time[df_time["jurisdiction"] == "Cour de cassation"]
 
-    df_time = (
-        df_time.groupby(["decision_date"]).agg({"n_decisions": "sum"}).reset_index()
-    )
+    df_time = group_sum(df_time, ["decision_date"])
 
     df_time["n_decisions_lisse"] = (
-        df_time["n_decisions"].rolling(window=12, center=True).mean()
+        df_time["n_decisions"].rolling(window=FORMATION_TIME_WINDOW, center=True).mean()
     )
 
     df_time = df_time.rename(
@@ -330,24 +284,8 @@ def get_formation_time_graph(df: pd.DataFrame):
         }
     )
 
-    fig = px.bar(
-        data_frame=df_time,
-        x="Mois",
-        y="Nombre de décisions",
-        color_discrete_sequence=[COLORS["rouge_marianne"], COLORS["bleu_france"]],
-    )
+    fig = bar(data_frame=df_time, **FORMATION_TIME_GRAPH)
 
-    fig.add_trace(
-        px.line(
-            data_frame=df_time,
-            x="Mois",
-            y="Nombre de décisions lissé",
-            color_discrete_sequence=[COLORS["bleu_france"]],
-        )
-    )
-
-    fig.update_layout(
-        plot_bgcolor="rgba(0,0,0,0)",
-    )
+    fig.add_traces(line(data_frame=df_time, **FORMATION_TIME_SMOOTHED_GRAPH).data)
 
     return fig
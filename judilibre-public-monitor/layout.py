@@ -4,9 +4,10 @@ from dash import dcc
 from dash import html
 from data.data_utils import LOCATIONS_CA
 from data.data_utils import remove_cour_dappel
+from downloads import DOWNLOAD_CHOICES
 
 
-def get_layout(include_download: bool = False):
+def get_layout(include_download: bool = False, clientside_filtering: bool = False):
     return html.Div(
         [
             get_header(),
@@ -19,10 +20,24 @@ def get_layout(include_download: bool = False):
             get_footer(),
             dcc.Interval(id="download-interval", interval=1000 * 60 * 60 * 2),
             html.Div(id="dummy-div", style={"display": "none"}),
+            # version of the data of the outputs independent of the dates
+            dcc.Store(id="global-version"),
+            get_clientside_stores(clientside_filtering=clientside_filtering),
         ]
     )
 
 
+def get_clientside_stores(clientside_filtering: bool = False):
+    # data of the graphs filtered by dates in the browser and its version
+    if clientside_filtering:
+        return html.Div(
+            [
+                dcc.Store(id="clientside-store"),
+                dcc.Store(id="clientside-version"),
+            ]
+        )
+
+
 def get_header():
     return html.Header(
         children=[
@@ -272,13 +287,7 @@ def get_download(include_download: bool = False):
                             className="label-for-download-picker",
                         ),
                         dcc.Dropdown(
-                            {
-                                "ca_location": "Nombre de décisions par cour d'appel",
-                                "ca_nac": "Nombre de décisions par code NAC",
-                                "ca_location_nac": "Nombre de décisions "
-                                "par cour d'appel et code NAC",
-                                "all_data": "Données complètes agrégées",
-                            },
+                            DOWNLOAD_CHOICES,
                             "ca_location",
                             multi=False,
                             clearable=False,
@@ -290,8 +299,36 @@ def get_download(include_download: bool = False):
                 ),
                 html.Div(
                     [
-                        html.Button("Télécharger", id="download-ca-submit"),
-                        dcc.Download(id="download-ca-data"),
+                        html.Label(
+                            "Format",
+                            htmlFor="download-ca-format",
+                            className="label-for-download-picker",
+                        ),
+                        dcc.Dropdown(
+                            {
+                                "csv": "CSV",
+                                "csv.gz": "CSV compressé (gzip)",
+                                "parquet": "Parquet",
+                                "arrow": "Arrow IPC",
+                            },
+                            "csv",
+                            multi=False,
+                            clearable=False,
+                            id="download-ca-format",
+                            style={"width": "100%"},
+                        ),
+                    ],
+                    className="row",
+                ),
+                html.Div(
+                    [
+                        # served by a route streaming the file, see main.download
+                        html.A(
+                            "Télécharger",
+                            id="download-ca-link",
+                            className="download-link",
+                            download="",
+                        ),
                     ],
                     className="row",
                 ),
@@ -1,80 +1,132 @@
-import datetime
+import json
 import logging
+import multiprocessing
 import os
+from functools import partial
 
+import pandas as pd
+from clientside import CLIENTSIDE_GRAPHS
+from clientside import get_clientside_data
+from dash import ClientsideFunction
 from dash import Dash
-from dash import dcc
 from dash import Input
+from dash import no_update
 from dash import Output
 from dash import State
-from data.download_latest_data import download_latest_data
+from data.cache import get_data_cache
+from data.dataset import open_id_index
 from data.load_data import get_download_data
-from data.load_data import load_data
+from data.refresh import refresh_data
+from data.refresh import RefreshWorker
 from dotenv import load_dotenv
-from flask_caching import Cache
-from graphs import get_chamber_graph
-from graphs import get_formation_time_graph
-from graphs import get_location_graph
-from graphs import get_nac_graph
-from graphs import get_nac_level_graph
-from graphs import get_nac_level_location_graph
-from graphs import get_nac_location_graph
-from graphs import get_source_graph
-from graphs import get_time_graph
-from graphs import get_time_location_graph
-from graphs import get_type_graph
+from downloads import DOWNLOAD_FORMATS
+from downloads import iter_chunks
+from downloads import iter_id_chunks
+from downloads import parse_download_filename
+from figure_cache import FigureCache
+from figure_cache import make_key
+from figure_executor import get_figure_executor
+from figure_executor import render_figure
+from flask import abort
+from flask import jsonify
+from flask import Response
 from layout import get_layout
+from metrics import get_metrics
+from metrics import observe_callback
+from metrics import observe_download
+from metrics import observe_figure_build
+from metrics import register_cache_collector
 
 load_dotenv()
 
 EXTERNAL_STYLESHEETS = ["assets/custom.css"]
 
-LATEST_UPDATE_DATE = datetime.date.today() - datetime.timedelta(days=1)
-
 UPDATE_DATA = bool(int(os.environ.get("UPDATE_DATA")))
 INCLUDE_DOWNLOAD = bool(int(os.environ.get("INCLUDE_DOWNLOAD")))
+DOWNLOAD_MAX_WORKERS = int(os.environ.get("DOWNLOAD_MAX_WORKERS", 4))
+REFRESH_INTERVAL = float(os.environ.get("REFRESH_INTERVAL", 24 * 60 * 60))
+FIGURE_CACHE_SIZE = int(os.environ.get("FIGURE_CACHE_SIZE", 256))
+FIGURE_EXECUTOR_KIND = os.environ.get("FIGURE_EXECUTOR", "thread")
+FIGURE_WORKERS = int(os.environ.get("FIGURE_WORKERS", 0)) or None
+CLIENTSIDE_FILTERING = bool(int(os.environ.get("CLIENTSIDE_FILTERING", 0)))
+
+
+DATA_PATH = os.environ.get("DATA_PATH", "./data")
+
+DATA_CACHE = get_data_cache(path=DATA_PATH)
 
+FIGURE_CACHE = FigureCache(
+    max_bytes=FIGURE_CACHE_SIZE * 1024 * 1024,
+    get_version=lambda: DATA_CACHE.version,
+)
+
+register_cache_collector(DATA_CACHE, FIGURE_CACHE)
+
+FIGURE_EXECUTOR = get_figure_executor(
+    kind=FIGURE_EXECUTOR_KIND, max_workers=FIGURE_WORKERS
+)
+
+REFRESH_WORKER = RefreshWorker(
+    refresh=partial(
+        refresh_data,
+        path=DATA_PATH,
+        api_key_id=os.environ.get("PISTE_API_KEY"),
+        api_url=os.environ.get("PISTE_API_URL"),
+        max_workers=DOWNLOAD_MAX_WORKERS,
+        timings=DATA_CACHE.load_timings,
+    ),
+    interval=REFRESH_INTERVAL,
+    lock_file=os.path.join(DATA_PATH, ".refresh.lock"),
+)
+
+# worker processes spawned to build figures import this module again
+if UPDATE_DATA and multiprocessing.parent_process() is None:
+    REFRESH_WORKER.start()
 
 app = Dash(
     title="Judilibre - Tableau de suivi",
     external_stylesheets=EXTERNAL_STYLESHEETS,
 )
 
-cache = Cache(app.server, config={"CACHE_TYPE": "filesystem", "CACHE_DIR": "cache"})
-
 app._favicon = "images/cour-de-cassation.svg"
 
 # adding language accessibility
 
 app._index_string = app._index_string.replace("<html>", "<html lang='fr'>")
 
-app.layout = get_layout(include_download=INCLUDE_DOWNLOAD)
+app.layout = get_layout(
+    include_download=INCLUDE_DOWNLOAD, clientside_filtering=CLIENTSIDE_FILTERING
+)
 
 
-@app.callback(
-    Output("source-graph", "figure"),
-    # Output("jurisdiction-graph", "figure"),
-    Output("time-graph", "figure"),
-    Output("location-graph", "figure"),
-    Output("nac-graph", "figure"),
-    Output("nb-decisions-card", "children"),
-    Output("date-latest-decision-card", "children"),
-    Output("chamber-graph", "figure"),
-    Output("type-graph", "figure"),
-    Output("nb-decisions-cc-card", "children"),
-    Output("nb-decisions-ca-card", "children"),
-    Output("nac-level-graph", "figure"),
-    Output("formation-time-graph", "figure"),
-    Input("dummy-input", "value"),
-    Input("start-date-picker", "date"),
-    Input("end-date-picker", "date"),
-)
-# @cache.memoize(timeout=3600)
-def update_graphs(n_clicks, start_date, end_date):
-    df = load_data(path="./data")
+def get_figures(version, keys: list[tuple]):
+    """Returns the figures of the given cache keys.
+
+    Figures missing from the figure cache are built concurrently on the figure
+    executor, so that the slowest figure sets the latency of a callback.
+    """
+    figures = [FIGURE_CACHE.get(version, key) for key in keys]
+
+    futures = {
+        i: FIGURE_EXECUTOR.submit(render_figure, DATA_PATH, *key)
+        for i, (key, figure) in enumerate(zip(keys, figures))
+        if figure is None
+    }
+    for i, future in futures.items():
+        figure_version, figures[i], duration = future.result()
+        FIGURE_CACHE.put(figure_version, keys[i], figures[i])
+        observe_figure_build(keys[i][0], duration)
 
-    source_graph = get_source_graph(df=df)
-    time_graph = get_time_graph(df=df)
+    return [json.loads(figure) for figure in figures]
+
+
+def get_global_outputs(df: pd.DataFrame):
+    """Returns the figures and cards that do not depend on the selected dates"""
+    graph_ids = ["source-graph", "time-graph"]
+    futures = [
+        FIGURE_EXECUTOR.submit(render_figure, DATA_PATH, graph_id)
+        for graph_id in graph_ids
+    ]
 
     nb_decisions = df["n_decisions"].sum()
     nb_decisions = f"{nb_decisions:,}".replace(",", " ")
@@ -89,34 +141,93 @@ def update_graphs(n_clicks, start_date, end_date):
     nb_decisions_ca = df.loc[df["jurisdiction"] == "Cours d'appel", "n_decisions"].sum()
     nb_decisions_ca = f"{nb_decisions_ca:,}".replace(",", " ")
 
-    df = df[df["decision_date"] >= start_date]
-    df = df[df["decision_date"] <= end_date]
-
-    location_graph = get_location_graph(df=df)
-    nac_graph = get_nac_graph(df=df)
-    chamber_graph = get_chamber_graph(df=df)
-    type_graph = get_type_graph(df=df)
-
-    nac_level_graph = get_nac_level_graph(df=df)
-
-    formation_time_graph = get_formation_time_graph(df=df)
+    figures = []
+    for graph_id, future in zip(graph_ids, futures):
+        _, figure, duration = future.result()
+        observe_figure_build(graph_id, duration)
+        figures.append(json.loads(figure))
+    source_graph, time_graph = figures
 
     return (
         source_graph,
         time_graph,
-        location_graph,
-        nac_graph,
         nb_decisions,
         max_date,
-        chamber_graph,
-        type_graph,
         nb_decisions_cc,
         nb_decisions_ca,
-        nac_level_graph,
-        formation_time_graph,
     )
 
 
+@app.callback(
+    Output("source-graph", "figure"),
+    # Output("jurisdiction-graph", "figure"),
+    Output("time-graph", "figure"),
+    Output("nb-decisions-card", "children"),
+    Output("date-latest-decision-card", "children"),
+    Output("nb-decisions-cc-card", "children"),
+    Output("nb-decisions-ca-card", "children"),
+    Output("global-version", "data"),
+    Input("dummy-input", "value"),
+    # checking regularly whether the data has been refreshed
+    Input("download-interval", "n_intervals"),
+    State("global-version", "data"),
+)
+@observe_callback
+def update_global_outputs(value, n_intervals, global_version):
+    _, version = DATA_CACHE.get_versioned()
+    if version == global_version:
+        return (no_update,) * 7
+    return *DATA_CACHE.get_derived("global_outputs", get_global_outputs), version
+
+
+DATE_GRAPH_IDS = list(CLIENTSIDE_GRAPHS)
+
+
+@observe_callback
+def update_graphs(start_date, end_date):
+    _, version = DATA_CACHE.get_versioned()
+    return get_figures(
+        version,
+        [
+            make_key(graph_id, start_date=start_date, end_date=end_date)
+            for graph_id in DATE_GRAPH_IDS
+        ],
+    )
+
+
+@observe_callback
+def update_clientside_store(value, n_intervals, clientside_version):
+    _, version = DATA_CACHE.get_versioned()
+    if version == clientside_version:
+        return no_update, no_update
+    return DATA_CACHE.get_derived("clientside_data", get_clientside_data), version
+
+
+if CLIENTSIDE_FILTERING:
+    # the graphs filtered by dates are built by assets/clientside_filtering.js
+    # from a monthly aggregate sent once per version of the data
+    app.callback(
+        Output("clientside-store", "data"),
+        Output("clientside-version", "data"),
+        Input("dummy-input", "value"),
+        Input("download-interval", "n_intervals"),
+        State("clientside-version", "data"),
+    )(update_clientside_store)
+    app.clientside_callback(
+        ClientsideFunction(namespace="judilibre", function_name="updateGraphs"),
+        *[Output(graph_id, "figure") for graph_id in DATE_GRAPH_IDS],
+        Input("clientside-store", "data"),
+        Input("start-date-picker", "date"),
+        Input("end-date-picker", "date"),
+    )
+else:
+    app.callback(
+        *[Output(graph_id, "figure") for graph_id in DATE_GRAPH_IDS],
+        Input("start-date-picker", "date"),
+        Input("end-date-picker", "date"),
+    )(update_graphs)
+
+
 @app.callback(
     Output("time-location-graph", "figure"),
     Output("nac-location-graph", "figure"),
@@ -125,51 +236,88 @@ def update_graphs(n_clicks, start_date, end_date):
     Input("start-date-picker", "date"),
     Input("end-date-picker", "date"),
 )
+@observe_callback
 def update_time_location_graph(locations, start_date, end_date):
-    df = load_data(path="./data")
-    df = df[df["decision_date"] >= start_date]
-    df = df[df["decision_date"] <= end_date]
-    time_location_graph = get_time_location_graph(df=df, locations=locations)
-    nac_location_graph = get_nac_location_graph(df=df, locations=locations)
-    nac_level_location_graph = get_nac_level_location_graph(df=df, locations=locations)
-    return time_location_graph, nac_location_graph, nac_level_location_graph
+    _, version = DATA_CACHE.get_versioned()
+    return get_figures(
+        version,
+        [
+            make_key(
+                graph_id, start_date=start_date, end_date=end_date, locations=locations
+            )
+            for graph_id in [
+                "time-location-graph",
+                "nac-location-graph",
+                "level-location-graph",
+            ]
+        ],
+    )
 
 
-@app.callback(
-    Output("download-ca-data", "data"),
-    State("download-ca-choice", "value"),
-    Input("download-ca-submit", "n_clicks"),
-    # State("start-date-picker", "date"),
-    # State("end-date-picker", "date"),
-    # prevent_initial_callbacks=True,
-)
-def download_data(data_choice, n_clicks):
-    if not n_clicks:
-        return None
-    df = load_data(path="./data")
-    df = get_download_data(
-        df=df,
-        choice=data_choice,
-        # start_date=start_date, end_date=end_date
+@observe_callback
+def update_download_link(data_choice, data_format):
+    return app.get_relative_path(f"/download/{data_choice}.{data_format}")
+
+
+def download(filename):
+    """Streams a download, serialized chunk by chunk so that large files are
+    never held in memory"""
+    parsed = parse_download_filename(filename)
+    if parsed is None:
+        abort(404)
+    data_choice, data_format = parsed
+    content_type, serialize = DOWNLOAD_FORMATS[data_format]
+
+    if data_choice == "all_ids":
+        # read from the id index instead of the decisions, the index being built
+        # and updated by the data refresh only
+        index = open_id_index(path=DATA_PATH)
+        if index is None:
+            abort(503)
+        chunks = iter_id_chunks(index)
+    else:
+        chunks = iter_chunks(get_download_data(df=DATA_CACHE.get(), choice=data_choice))
+
+    return Response(
+        observe_download(serialize(chunks), data_choice, data_format),
+        content_type=content_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
-    return dcc.send_data_frame(df.to_csv, filename=f"{data_choice}.csv")
+
+
+if INCLUDE_DOWNLOAD:
+    app.callback(
+        Output("download-ca-link", "href"),
+        Input("download-ca-choice", "value"),
+        Input("download-ca-format", "value"),
+    )(update_download_link)
+    app.server.route("/download/<filename>")(download)
 
 
 @app.callback(
     Output("dummy-div", "children"), Input("download-interval", "n_intervals")
 )
+@observe_callback
 def update_data(n_interval):
-    global LATEST_UPDATE_DATE
-    global UPDATE_DATA
-    if (LATEST_UPDATE_DATE != datetime.date.today()) and UPDATE_DATA:
-        print(f"{datetime.datetime.now()} - Downloading new data")
-        download_latest_data(
-            api_key_id=os.environ.get("PISTE_API_KEY"),
-            api_url=os.environ.get("PISTE_API_URL"),
-            reference_file="./data/full_data.parquet",
-            target_file="./data/full_data.parquet",
-        )
-        LATEST_UPDATE_DATE = datetime.date.today()
+    # data is refreshed by REFRESH_WORKER, this only reports its status
+    status = REFRESH_WORKER.status()
+    return f"{status['last_status']} - {status['last_run_start']}"
+
+
+@app.server.route("/refresh-status")
+def refresh_status():
+    return jsonify(REFRESH_WORKER.status())
+
+
+@app.server.route("/cache-stats")
+def cache_stats():
+    return jsonify({"data": DATA_CACHE.stats(), "figures": FIGURE_CACHE.stats()})
+
+
+@app.server.route("/metrics")
+def metrics():
+    data, content_type = get_metrics()
+    return Response(data, content_type=content_type)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+import functools
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import generate_latest
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.core import InfoMetricFamily
+
+# from a few milliseconds for cached figures to the download of the full data
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CALLBACK_LATENCY = Histogram(
+    "judilibre_callback_duration_seconds",
+    "Duration of the Dash callbacks",
+    ["callback"],
+    buckets=LATENCY_BUCKETS,
+)
+
+FIGURE_BUILD_LATENCY = Histogram(
+    "judilibre_figure_build_duration_seconds",
+    "Duration of the builds of the figures missing from the figure cache",
+    ["graph"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DOWNLOAD_LATENCY = Histogram(
+    "judilibre_download_duration_seconds",
+    "Duration of the downloads, until their last byte is sent",
+    ["choice", "format"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def observe_callback(function):
+    """Records the duration of each call of a callback, named after its function"""
+    histogram = CALLBACK_LATENCY.labels(callback=function.__name__)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def observe_figure_build(graph_id: str, duration: float):
+    FIGURE_BUILD_LATENCY.labels(graph=graph_id).observe(duration)
+
+
+def observe_download(chunks, choice: str, data_format: str):
+    """Yields the chunks of a streamed download, recording its duration once
+    sent or interrupted"""
+    histogram = DOWNLOAD_LATENCY.labels(choice=choice, format=data_format)
+    start = time.perf_counter()
+    try:
+        yield from chunks
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+class CacheCollector:
+    """Reports the state of the data and figure caches when metrics are scraped"""
+
+    def __init__(self, data_cache, figure_cache):
+        self.data_cache = data_cache
+        self.figure_cache = figure_cache
+
+    def collect(self):
+        data_stats = self.data_cache.stats()
+        figure_stats = self.figure_cache.stats()
+
+        version = InfoMetricFamily(
+            "judilibre_data_version", "Version of the data served"
+        )
+        version.add_metric([], {"version": data_stats["version"] or ""})
+        yield version
+
+        cube_bytes = GaugeMetricFamily(
+            "judilibre_cube_bytes", "Memory used by the cube loaded in memory"
+        )
+        cube_bytes.add_metric([], data_stats["bytes"] or 0)
+        yield cube_bytes
+
+        figure_bytes = GaugeMetricFamily(
+            "judilibre_figure_cache_bytes", "Size of the figures of the figure cache"
+        )
+        figure_bytes.add_metric([], figure_stats["bytes"])
+        yield figure_bytes
+
+        hits = CounterMetricFamily(
+            "judilibre_cache_hits", "Requests served from a cache", labels=["cache"]
+        )
+        misses = CounterMetricFamily(
+            "judilibre_cache_misses", "Requests missing from a cache", labels=["cache"]
+        )
+        hit_ratio = GaugeMetricFamily(
+            "judilibre_cache_hit_ratio",
+            "Share of the requests served from a cache",
+            labels=["cache"],
+        )
+        for cache, stats in [("data", data_stats), ("figures", figure_stats)]:
+            hits.add_metric([cache], stats["hits"])
+            misses.add_metric([cache], stats["misses"])
+            if stats["hit_ratio"] is not None:
+                hit_ratio.add_metric([cache], stats["hit_ratio"])
+        yield hits
+        yield misses
+        yield hit_ratio
+
+        reload_time = GaugeMetricFamily(
+            "judilibre_data_last_reload_seconds",
+            "Duration of the last reload of the cube",
+        )
+        if data_stats["last_reload_time"] is not None:
+            reload_time.add_metric([], data_stats["last_reload_time"])
+        yield reload_time
+
+        load_timings = GaugeMetricFamily(
+            "judilibre_load_data_stage_seconds",
+            "Duration of the stages of the last computation of the cube",
+            labels=["stage"],
+        )
+        for stage, duration in data_stats["load_timings"].items():
+            load_timings.add_metric([stage], duration)
+        yield load_timings
+
+
+def register_cache_collector(data_cache, figure_cache):
+    REGISTRY.register(CacheCollector(data_cache, figure_cache))
+
+
+def get_metrics():
+    """Returns the metrics in the Prometheus text format and their content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST